@@ -3,76 +3,183 @@
 # Author: Justin Ibarra (justin.s.ibarra@gmail.com)
 # License: MIT - A full copy of the license is provided with this source code
 
-from incidents import Incident, Event, threading
+from incidents import Incident, IncidentFetchPlan, IncidentFetchResult, IncidentFailure, Event, EventFailure, \
+    AlertLogic, fetch_incident_details
 from errors import IncidentNotRetrievedError, EventNotRetrievedError
+from pool import WorkerPool, CONSOLE_HOST
+from client import Client, SessionManager
+from pipeline import ParsePool
+from results import FetchResult, timed
+from deadline import Deadline, as_deadline
+from instrument import add_hook, remove_hook, MetricsCollector
 
 
-def get_event(event_id, customer_id, username, password, to_json=False):
-    event = Event(event_id, customer_id)
-    event.set_credentials(username, password)
-    event.get_event()
+def set_event_cache(event_cache):
+    """ Sets the EventCache (see cache.py) checked by every Event, get_event(s) and Incident before downloading """
+    AlertLogic.event_cache = event_cache
+
+
+def set_page_archive(page_archive):
+    """ Sets the PageArchive (see archive.py) every downloaded event page is added to; see archive.replay_events """
+    AlertLogic.page_archive = page_archive
+
+
+def _use_credentials(username, password, client=None):
+    """ Sets the class level credentials when both are given; otherwise the ones set earlier are kept """
+    if client is not None or username is None or password is None:  # a Client keeps its own credentials and session
+        return
+    if AlertLogic.username != username or AlertLogic.password != password:
+        AlertLogic.username = username
+        AlertLogic.password = password
+        AlertLogic.al_logged_in = False  # Event.get_event logs in once the cache misses
+
+
+def _retry_deadline(deadline):
+    """ The deadline for retry_failed: a new one of the same seconds, as the deadline of the first try expired """
+    if isinstance(deadline, Deadline):
+        return deadline.seconds if not deadline.cancelled else deadline
+    return deadline
+
+
+def get_event(event_id, customer_id, username=None, password=None, to_json=False, client=None, deadline=None):
+    _use_credentials(username, password, client)
+    event = Event(event_id, customer_id, client=client, deadline=as_deadline(deadline))
     if to_json:
         return event.to_json()
     else:
         return event
 
 
-def get_events(event_id_list, customer_id, username, password, suppress_errors=True, to_json=False):
-    event_dict = {}
-    threads = []
-    errors = []
-
-    def __multi_get_events(thread_event_id):  # for threading
-        try:
-            if to_json:
-                event_dict[thread_event_id] = get_event(thread_event_id, customer_id, username, password).to_json()
-            else:
-                event_dict[thread_event_id] = get_event(thread_event_id, customer_id, username, password)
-        except Exception as e:
-            errors.append(e.message)
-            pass
-
-    for i in event_id_list:
-        t = threading.Thread(target=__multi_get_events, args=(i,))
-        threads.append(t)
-        t.start()
-    for _thread in threads:
-        _thread.join()
-    if not suppress_errors:
-        raise EventNotRetrievedError('Their were errors retrieving some events: {0}'.format(errors))
-    return event_dict
-
-
-def get_incident(incident_id, customer_id, api_key, username, password, to_json=False):
+def get_events(event_id_list, customer_id, username=None, password=None, suppress_errors=True, to_json=False,
+               pool=None, client=None, parse_pool=None, deadline=None):
+    """ Retrieves all events with a bounded WorkerPool. Returns a FetchResult (see results.py): the dict of
+        {event_id: Event} in the order of event_id_list, with the EventFailures of the events which could not be
+        retrieved and the seconds each event took; its retry_failed() retrieves only the failed events again. Unless
+        suppress_errors, an EventNotRetrievedError is raised if any event failed. With a client (see
+        client.SessionManager), its credentials and session are used instead of username and password. With a
+        parse_pool (see pipeline.ParsePool), the event pages are parsed in its worker processes. With a deadline
+        (seconds or a Deadline, see deadline.py), the events which did not finish before it expired or was cancelled
+        are returned as failures; retry_failed() then starts a new deadline of the same seconds
+    """
+    event_id_list = list(event_id_list)
+    current_deadline = as_deadline(deadline)
+
+    def __fetch(failed_ids):  # for retry_failed
+        return get_events(failed_ids, customer_id, username, password, to_json=to_json, pool=pool, client=client,
+                          parse_pool=parse_pool, deadline=_retry_deadline(deadline))
+
+    result = FetchResult(ids=event_id_list, fetch=__fetch)
+    if parse_pool is not None:
+        retrieved = dict((event.event_id, event) for event in iter_events(
+            event_id_list, customer_id, username, password, pool=pool, client=client, parse_pool=parse_pool,
+            deadline=current_deadline))
+        outcomes = [(event_id, retrieved[event_id] if event_id in retrieved else
+                     EventFailure(event_id, current_deadline.error()), None) for event_id in event_id_list]
+    else:
+        pool = pool if pool is not None else WorkerPool()
+
+        def __multi_get_events(thread_event_id):  # for the worker pool
+            return get_event(thread_event_id, customer_id, username, password, client=client,
+                             deadline=current_deadline)
+
+        outcomes = [(event_id, EventFailure(event_id, error), None) if error is not None else (event_id,) + outcome
+                    for event_id, outcome, error in pool.map(timed(__multi_get_events), event_id_list,
+                                                             host=CONSOLE_HOST, deadline=current_deadline)]
+    for event_id, event, elapsed in outcomes:
+        if isinstance(event, EventFailure):
+            result.add_failure(event_id, event)
+        else:
+            result.add(event_id, event.to_json() if to_json else event, elapsed)
+    if not suppress_errors and result.failures:
+        raise EventNotRetrievedError('Their were errors retrieving some events: {0}'.format(result.errors))
+    return result
+
+
+def iter_events(event_id_list, customer_id, username=None, password=None, to_json=False, pool=None, client=None,
+                parse_pool=None, deadline=None):
+    """ Generator version of get_events which yields each Event (or EventFailure) as soon as it is retrieved, in
+        completion order. Only pool.max_queue finished events are held before the workers wait on the consumer. Once
+        the deadline expires, the events in progress are yielded as failures and the rest of event_id_list is skipped
+    """
+    deadline = as_deadline(deadline)
+    if parse_pool is not None:
+        _use_credentials(username, password, client)
+        for event in parse_pool.iter_events(event_id_list, customer_id, client=client, pool=pool, deadline=deadline):
+            yield event.to_json() if to_json else event
+        return
+    pool = pool if pool is not None else WorkerPool()
+
+    def __multi_get_events(thread_event_id):  # for the worker pool
+        return get_event(thread_event_id, customer_id, username, password, client=client, deadline=deadline)
+
+    for event_id, outcome, error in pool.imap_unordered(timed(__multi_get_events), event_id_list, host=CONSOLE_HOST,
+                                                        deadline=deadline):
+        event = EventFailure(event_id, error) if error is not None else outcome[0]
+        yield event.to_json() if to_json else event
+
+
+def get_incident(incident_id, customer_id, api_key=None, username=None, password=None, to_json=False, pool=None,
+                 client=None, deadline=None):
+    incident = Incident(incident_id, customer_id, api_key, username, password, pool=pool, client=client,
+                        deadline=deadline)
     if to_json:
-        return Incident(incident_id, customer_id, api_key, username, password).to_json()
+        return incident.to_json()
     else:
-        return Incident(incident_id, customer_id, api_key, username, password)
-
-
-def get_incidents(incident_id_list, customer_id, api_key, username, password, suppress_errors=True, to_json=False):
-    incident_dict = {}
-    threads = []
-    errors = []
-
-    def __multi_get_incidents(thread_incident_id):  # for threading
-        try:
-            if to_json:
-                incident_dict[thread_incident_id] = get_incident(
-                    thread_incident_id, customer_id, api_key, username, password).to_json()
-            else:
-                incident_dict[thread_incident_id] = get_incident(
-                    thread_incident_id, customer_id, api_key, username, password)
-        except Exception as e:
-            errors.append(e.message)
-            pass
-
-    for i in incident_id_list:
-        t = threading.Thread(target=__multi_get_incidents, args=(i,))
-        threads.append(t)
-        t.start()
-    for _thread in threads:
-        _thread.join()
-    if not suppress_errors:
-        raise IncidentNotRetrievedError('Their were errors retrieving some incidents: {0}'.format(errors))
-    return incident_dict
+        return incident
+
+
+def get_incidents(incident_id_list, customer_id, api_key=None, username=None, password=None, suppress_errors=True,
+                  to_json=False, pool=None, client=None, deadline=None):
+    """ Retrieves the details of all incidents in batched incident API calls, then fetches the union of their events
+        once with a bounded WorkerPool (see IncidentFetchPlan) and builds each Incident from the shared Event objects.
+        Returns an IncidentFetchResult: the dict of {incident_id: Incident} in the order of incident_id_list, with
+        the incidents which were not retrieved as failures and the failed events of each in Incident.failures; its
+        retry_failed() retrieves only those again. An incident API call which failed makes every incident of its batch
+        a failure. Unless suppress_errors, an IncidentNotRetrievedError is raised if any incident or event failed.
+        With a deadline (seconds or a Deadline, see deadline.py), the incidents and events which did not finish before
+        it expired or was cancelled are failures (of the result or of their incidents)
+    """
+    incident_id_list = list(incident_id_list)
+    current_deadline = as_deadline(deadline)
+    pool = pool if pool is not None else WorkerPool()
+    _use_credentials(username, password, client)
+    errors = {}  # incident_id: exception of its failed incident API call
+    if client is not None:
+        incident_details = fetch_incident_details(client.session, client.api_key, incident_id_list, customer_id,
+                                                  fetcher=client.get_fetcher(), deadline=current_deadline,
+                                                  errors=errors)
+    else:
+        if api_key is not None:
+            AlertLogic.api_key = api_key
+        incident_details = fetch_incident_details(AlertLogic.alogic, AlertLogic.api_key, incident_id_list, customer_id,
+                                                  deadline=current_deadline, errors=errors)
+    plan = IncidentFetchPlan(incident_details, customer_id)
+
+    def __fetch_event(event_id, event_customer_id, deadline=None):
+        return Event(event_id, event_customer_id, client=client, deadline=deadline)
+
+    def __fetch(failed_ids):  # for retry_failed
+        return get_incidents(failed_ids, customer_id, api_key, username, password, to_json=to_json, pool=pool,
+                             client=client, deadline=_retry_deadline(deadline))
+
+    result = IncidentFetchResult(ids=incident_id_list, fetch=__fetch, pool=pool, fetch_event=__fetch_event,
+                                 as_json=to_json, deadline=_retry_deadline(deadline))
+    events, failures, timings = plan.fetch_events(pool, __fetch_event, current_deadline)
+    for incident_id in incident_id_list:
+        if str(incident_id) in errors:
+            result.add_failure(incident_id, IncidentFailure(incident_id, errors[str(incident_id)]))
+            continue
+        if str(incident_id) not in incident_details:
+            result.add_failure(incident_id, IncidentFailure(incident_id, IncidentNotRetrievedError(
+                'Incident {0} was not returned by the incident API'.format(incident_id))))
+            continue
+        incident = Incident(incident_id, customer_id, pool=pool, incident_details=incident_details[str(incident_id)],
+                            events=plan.events_for(str(incident_id), events), client=client)
+        incident.failures = plan.events_for(str(incident_id), failures)
+        incident.timings = plan.events_for(str(incident_id), timings)
+        result.add_incident(incident_id, incident)
+    event_failures = result.event_failures()
+    if not suppress_errors and (result.failures or event_failures):
+        raise IncidentNotRetrievedError('Their were errors retrieving some incidents: {0}'.format(
+            result.errors + [failure.message for failure in event_failures.values()]))
+    return result
@@ -3,12 +3,33 @@
     program. Finally, the requests Session is declared here, outside of the class in order to preserve throughout use.
 """
 
-import requests
+import threading
 from errors import *
+from cache import SignatureCache
+import transport
+import instrument
+from retry import Fetcher
+from deadline import acquire_lock
 
 
 class ALCommon(object):
     """class for shared attributes across all classes"""
+    __slots__ = ()  # lets the event classes define compact __slots__
+
+    def __getstate__(self):
+        """ The set slots of every class in the hierarchy (and __dict__, if any), so slotted classes can be pickled
+            with any protocol
+        """
+        state = dict(getattr(self, '__dict__', {}))
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if name != '__dict__' and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
 
     def to_json(self):
         """ to return json implementation"""
@@ -17,38 +38,148 @@ class ALCommon(object):
 
 class AlertLogic(ALCommon):
     """Shared attributes with Events and Incidents; primarily credentials"""
+    __slots__ = ()
     api_key = None
     username = None
     password = None
     al_logged_in = False         # allows sub classes to detect if a log-in was already initiated
-    alogic = requests.Session()  # persistent session across all sub-classes
+    login_generation = 0         # incremented by every log-in; detects whether another thread already logged in again
+    login_lock = threading.Lock()
+    alogic = transport.new_session()  # persistent session across all sub-classes; pooled per host
+    event_cache = None           # EventCache checked by Event.get_event before the event page is downloaded
+    page_archive = None          # PageArchive (see archive.py) every downloaded event page is added to
+    signature_cache = SignatureCache()  # process wide signature details; shared by all events
+    fetcher = Fetcher()          # rate limits and retries every page and API fetch
+    client = None                # per-tenant Client (see client.py); None uses the class level credentials and session
 
     def set_api_key(self, api_key):
         AlertLogic.api_key = api_key
 
+    def set_event_cache(self, event_cache):
+        """Sets the global EventCache (see cache.py); None disables caching"""
+        AlertLogic.event_cache = event_cache
+
+    def set_page_archive(self, page_archive):
+        """Sets the global PageArchive (see archive.py); None stops archiving the event pages"""
+        AlertLogic.page_archive = page_archive
+
+    def set_signature_cache(self, signature_cache):
+        """Replaces the global SignatureCache, e.g. with one persisted to a path"""
+        AlertLogic.signature_cache = signature_cache
+
+    def set_fetcher(self, fetcher):
+        """Replaces the global Fetcher, e.g. with a different RetryPolicy or rate limits (see retry.py)"""
+        AlertLogic.fetcher = fetcher
+
     def set_credentials(self, username, password):
         """Sets global credentials and logs into Alert Logic with the session"""
         AlertLogic.username = username
         AlertLogic.password = password
         AlertLogic.login_al(self)
 
-    def reset_requests_session(self):
-        """ resets request session for all """
-        AlertLogic.alogic = requests.Session()
-
-    def login_al(self):
-        login_params = {#'SMENC': 'ISO-8859-1',
-                        'SMLOCALE': 'US-EN',
-                        'target': '-SM-/',
-                        'SMAUTHREASON': 0,
-                        'user': AlertLogic.username,
-                        'password': AlertLogic.password
-                        }
-        r = AlertLogic.alogic.post('https://console.clouddefender.alertlogic.com/forms/login2.fcc', data=login_params)
-        if r.status_code != 200:
-            raise NotAuthenticatedError('Failed to authenticate with username and password. Status code: {0}\n'
-                                        'Exception: {1}'.format(r.status_code, r.reason))
+    def reset_requests_session(self, pool_sizes=None):
+        """ resets request session for all; pool_sizes is {host: connections} (see transport.new_session) """
+        AlertLogic.alogic = transport.new_session(pool_sizes)
+        AlertLogic.al_logged_in = False
+
+    def get_connection_stats(self):
+        """ Returns the connection reuse counters of the shared session (see transport.connection_stats) """
+        return transport.connection_stats(AlertLogic.alogic)
+
+    def login_al(self, deadline=None):
+        login(AlertLogic.alogic, AlertLogic.username, AlertLogic.password, deadline)
+        AlertLogic.login_generation += 1
         AlertLogic.al_logged_in = True
         return
 
+    def ensure_logged_in(self, deadline=None):
+        """ Logs in unless already logged in; concurrent callers wait for a single log-in (until the deadline, if
+            given, expires)
+        """
+        if AlertLogic.al_logged_in:
+            return
+        acquire_lock(AlertLogic.login_lock, deadline)
+        try:
+            if not AlertLogic.al_logged_in:
+                self.login_al(deadline)
+        finally:
+            AlertLogic.login_lock.release()
+
+    def relogin(self, generation, deadline=None):
+        """ Logs in again after the session expired, unless another thread already did since login_generation was
+            generation; so however many threads see the expiry, only one of them logs in
+        """
+        acquire_lock(AlertLogic.login_lock, deadline)
+        try:
+            if AlertLogic.login_generation == generation:
+                AlertLogic.al_logged_in = False
+                self.login_al(deadline)
+        finally:
+            AlertLogic.login_lock.release()
+
+    def has_credentials(self):
+        """ True if console pages can be retrieved, either through a client or the class level credentials """
+        return self.client is not None or (self.username is not None and self.password is not None)
+
+    def get_session(self):
+        return self.client.session if self.client is not None else AlertLogic.alogic
+
+    def get_api_key(self):
+        return self.client.api_key if self.client is not None else self.api_key
+
+    def get_fetcher(self):
+        return self.client.get_fetcher() if self.client is not None else AlertLogic.fetcher
+
+    def console_get(self, url, attempts=None, **kwargs):
+        """ GETs a console page through the shared fetcher. If the SiteMinder session expired, logs in again (once for
+            all threads) and retries the request transparently. With a client, its own session and log-in are used
+        """
+        if self.client is not None:
+            return self.client.console_get(url, attempts=attempts, **kwargs)
+        self.ensure_logged_in(kwargs.get('deadline'))
+        generation = AlertLogic.login_generation
+        r = AlertLogic.fetcher.get(AlertLogic.alogic, url, attempts=attempts, **kwargs)
+        if session_expired(r):
+            self.relogin(generation, kwargs.get('deadline'))
+            r = AlertLogic.fetcher.get(AlertLogic.alogic, url, attempts=attempts, **kwargs)
+        return r
+
+
+LOGIN_URL = 'https://console.clouddefender.alertlogic.com/forms/login2.fcc'
+LOGIN_MARKERS = ('/forms/login', 'smauthreason')
+
+
+def login(session, username, password, deadline=None):
+    """ Logs the session into the console; raises NotAuthenticatedError if the log-in is refused. With a deadline
+        (see deadline.py), the request timeout is cut to the time left and its error is raised once it expired
+    """
+    login_params = {#'SMENC': 'ISO-8859-1',
+                    'SMLOCALE': 'US-EN',
+                    'target': '-SM-/',
+                    'SMAUTHREASON': 0,
+                    'user': username,
+                    'password': password
+                    }
+    started = instrument.timer()
+    if deadline is None:
+        r = session.post(LOGIN_URL, data=login_params)
+    else:
+        deadline.check()
+        try:
+            r = session.post(LOGIN_URL, data=login_params, timeout=deadline.timeout())
+        except Exception:
+            deadline.check()
+            raise
+    instrument.record('login', started, bytes=len(r.content))
+    if r.status_code != 200:
+        raise NotAuthenticatedError('Failed to authenticate with username and password. Status code: {0}\n'
+                                    'Exception: {1}'.format(r.status_code, r.reason))
+
 
+def session_expired(response):
+    """ True if the response is (or was redirected to) the console log-in page """
+    if response.status_code in (301, 302, 303, 307):
+        location = response.headers.get('Location', '').lower()
+        return any(marker in location for marker in LOGIN_MARKERS)
+    urls = [response.url] + [redirect.url for redirect in getattr(response, 'history', [])]
+    return any(marker in (url or '').lower() for url in urls for marker in LOGIN_MARKERS)
@@ -0,0 +1,210 @@
+""" Archive of the raw event pages. Every downloaded event page can be appended, compressed, to a segment file, so the
+    events can later be rebuilt from the archive with the current parser (for instance after the console HTML changed)
+    without downloading anything. Set the archive for all events with AlertLogic.set_page_archive(); replay_events()
+    is the offline mode. An archive is a directory of segment files and an index of where each event's page is.
+"""
+
+import os
+import struct
+import threading
+import zlib
+from events import Event, EventFailure, parse_event_page
+from errors import EventNotRetrievedError, EventParseError
+
+
+RECORD_HEADER = struct.Struct('>HII')  # key length, data length, crc32 of the data
+SEGMENT_SIZE = 256 * 1024 * 1024       # a new segment file is started once this size is reached
+INDEX_NAME = 'index'
+
+
+class PageArchive(object):
+    """ Append-only archive of zlib compressed event pages keyed by (customer_id, event_id). Records are only ever
+        appended to the last segment, and the index (customer_id, event_id, segment, offset, length per line) is
+        appended alongside. On opening, records missing from the index (a crash between the two writes) are recovered
+        from the segment and a torn last record is cut off. One process may write to an archive at a time.
+    """
+
+    def __init__(self, path, segment_size=SEGMENT_SIZE):
+        self.path = path
+        self.segment_size = segment_size
+        self.__index = {}     # (customer_id, event_id): (segment, offset, length)
+        self.__readers = {}   # segment: open file
+        self.__lock = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.__load_index()
+        self.__segment = max(self.segments() or [0])
+        self.__writer = open(self.segment_path(self.__segment), 'ab')
+        self.__index_file = open(os.path.join(path, INDEX_NAME), 'a')
+
+    @staticmethod
+    def key(customer_id, event_id):
+        return str(customer_id), str(event_id)
+
+    def segment_path(self, segment):
+        return os.path.join(self.path, '{0:06d}.seg'.format(segment))
+
+    def segments(self):
+        return sorted(int(name[:-4]) for name in os.listdir(self.path) if name.endswith('.seg'))
+
+    def put(self, customer_id, event_id, page):
+        """ Appends the page unless the event is already archived; event pages do not change """
+        key = self.key(customer_id, event_id)
+        data = zlib.compress(page)
+        record_key = ':'.join(key)
+        record = RECORD_HEADER.pack(len(record_key), len(data), zlib.crc32(data) & 0xffffffff) + record_key + data
+        with self.__lock:
+            if key in self.__index:
+                return
+            offset = self.__writer.tell()
+            if offset > 0 and offset + len(record) > self.segment_size:
+                self.__writer.close()
+                self.__segment += 1
+                self.__writer = open(self.segment_path(self.__segment), 'ab')
+                offset = 0
+            self.__writer.write(record)
+            self.__writer.flush()
+            self.__index[key] = (self.__segment, offset, len(record))
+            self.__index_file.write('{0}\t{1}\t{2}\t{3}\t{4}\n'.format(key[0], key[1], self.__segment, offset,
+                                                                       len(record)))
+            self.__index_file.flush()
+
+    def get(self, customer_id, event_id):
+        """ Returns the archived page or None """
+        with self.__lock:
+            location = self.__index.get(self.key(customer_id, event_id))
+            if location is None:
+                return None
+            segment, offset, length = location
+            if segment not in self.__readers:
+                self.__readers[segment] = open(self.segment_path(segment), 'rb')
+            reader = self.__readers[segment]
+            reader.seek(offset)
+            record = reader.read(length)
+        return self.__decode(record)[1]
+
+    def keys(self):
+        with self.__lock:
+            return self.__index.keys()
+
+    def __contains__(self, key):
+        with self.__lock:
+            return self.key(*key) in self.__index
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__index)
+
+    def iter_pages(self):
+        """ Yields (customer_id, event_id, page) for every archived page, reading the segments sequentially """
+        for segment in self.segments():
+            with open(self.segment_path(segment), 'rb') as f:
+                for offset, key, page in self.__scan(f):
+                    yield key[0], key[1], page
+
+    def close(self):
+        with self.__lock:
+            self.__writer.close()
+            self.__index_file.close()
+            for reader in self.__readers.values():
+                reader.close()
+            self.__readers.clear()
+
+    @staticmethod
+    def __decode(record):
+        """ Returns ((customer_id, event_id), page) for a whole record; raises ValueError if it is corrupt """
+        key_length, data_length, crc = RECORD_HEADER.unpack_from(record)
+        key_end = RECORD_HEADER.size + key_length
+        data = record[key_end:key_end + data_length]
+        if len(data) != data_length or zlib.crc32(data) & 0xffffffff != crc:
+            raise ValueError('Corrupt archive record')
+        return tuple(record[RECORD_HEADER.size:key_end].split(':', 1)), zlib.decompress(data)
+
+    def __scan(self, f, offset=0):
+        """ Yields (offset, key, page) for every whole record in the segment file from offset """
+        f.seek(offset)
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            key_length, data_length, crc = RECORD_HEADER.unpack(header)
+            body = f.read(key_length + data_length)
+            try:
+                key, page = self.__decode(header + body)
+            except (ValueError, zlib.error):
+                return
+            yield offset, key, page
+            offset += RECORD_HEADER.size + len(body)
+
+    def __load_index(self):
+        ends = {}  # segment: end of the last indexed record
+        index_path = os.path.join(self.path, INDEX_NAME)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) != 5:
+                        continue  # torn last line
+                    segment, offset, length = int(fields[2]), int(fields[3]), int(fields[4])
+                    self.__index[(fields[0], fields[1])] = (segment, offset, length)
+                    ends[segment] = max(ends.get(segment, 0), offset + length)
+        recovered = []
+        for segment in self.segments():
+            path = self.segment_path(segment)
+            size = os.path.getsize(path)
+            end = ends.get(segment, 0)
+            if end > size:  # the segment was truncated behind the index
+                self.__index = dict((k, v) for k, v in self.__index.items() if v[0] != segment or v[1] + v[2] <= size)
+                end = max([v[1] + v[2] for v in self.__index.values() if v[0] == segment] or [0])
+            with open(path, 'rb') as f:
+                for offset, key, page in self.__scan(f, end):
+                    length = f.tell() - offset
+                    if self.__index.get(key) != (segment, offset, length):
+                        self.__index[key] = (segment, offset, length)
+                        recovered.append((key, segment, offset, length))
+                    end = offset + length
+            if end < size:
+                with open(path, 'r+b') as f:
+                    f.truncate(end)  # cut off a torn record so appends start at a record boundary
+        if recovered:
+            with open(index_path, 'a') as f:
+                for key, segment, offset, length in recovered:
+                    f.write('{0}\t{1}\t{2}\t{3}\t{4}\n'.format(key[0], key[1], segment, offset, length))
+
+
+def replay_events(archive, keys=None, parse_pool=None):
+    """ Offline mode: rebuilds and yields the Event of every archived page (or of the (customer_id, event_id) keys)
+        with the current parser, without any network access. Signature rules which were not on the event page are
+        taken from the signature cache when present. With a parse_pool (see pipeline.ParsePool), the pages are parsed
+        in its processes. Events which cannot be parsed are yielded as EventFailure.
+    """
+    if keys is None:
+        pages = archive.iter_pages()
+    else:
+        pages = ((customer_id, event_id, archive.get(customer_id, event_id)) for customer_id, event_id in keys)
+
+    def __event_pages():
+        for customer_id, event_id, page in pages:
+            if page is None:
+                yield EventFailure(event_id, EventNotRetrievedError('Event #{0} of customer {1} is not in the '
+                                                                    'archive'.format(event_id, customer_id))), None
+                continue
+            event = Event(event_id, customer_id, lazy=True)
+            event.event_url = event.get_event_url()
+            yield event, page
+
+    if parse_pool is not None:
+        for event in parse_pool.parse_events(__event_pages(), fetch_signatures=False):
+            yield event
+        return
+    for event, page in __event_pages():
+        if page is None:
+            yield event
+            continue
+        try:
+            event.load_parsed(parse_event_page(page), fetch_signature=False)
+        except Exception as e:
+            yield EventFailure(event.event_id, EventParseError('Failed to parse event #{0}. {1}: {2}'.format(
+                event.event_id, type(e).__name__, e)))
+            continue
+        yield event
@@ -0,0 +1,232 @@
+""" Pluggable caches for parsed events. Threat manager events never change once they are written, so a parsed event
+    can be stored once, keyed by (customer_id, event_id), and served from the cache on every later request instead of
+    downloading and parsing the event page again. Set the cache for all events with AlertLogic.set_event_cache().
+    SignatureCache holds signature rules, which are shared by most of the events in an incident.
+"""
+
+import cPickle
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from deadline import wait_event
+
+
+class EventCache(object):
+    """ Base class for event caches; get returns the dict from Event.to_cache() or None on a miss """
+
+    def get(self, customer_id, event_id):
+        return None
+
+    def put(self, customer_id, event_id, event_data):
+        return
+
+    @staticmethod
+    def key(customer_id, event_id):
+        return str(customer_id), str(event_id)
+
+
+class MemoryEventCache(EventCache):
+    """ In-process LRU cache; entries older than max_age seconds (if set) are treated as misses """
+
+    def __init__(self, max_entries=10000, max_age=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.__entries = OrderedDict()  # key: (time stored, event_data)
+        self.__lock = threading.Lock()
+
+    def get(self, customer_id, event_id):
+        key = self.key(customer_id, event_id)
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is None:
+                return None
+            if self.max_age is not None and time.time() - entry[0] > self.max_age:
+                return None
+            self.__entries[key] = entry  # most recently used goes to the end
+            return entry[1]
+
+    def put(self, customer_id, event_id, event_data):
+        key = self.key(customer_id, event_id)
+        with self.__lock:
+            self.__entries.pop(key, None)
+            self.__entries[key] = (time.time(), event_data)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+
+
+class SqliteEventCache(EventCache):
+    """ Persistent cache stored in a local SQLite file. Entries are compressed pickles of Event.to_cache(). Entries
+        older than max_age seconds (if set) are expired, and once more than max_entries are stored the least recently
+        used are evicted. Eviction runs when the cache is opened and every evict_interval puts.
+    """
+
+    def __init__(self, path, max_entries=100000, max_age=None, evict_interval=100):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self.__puts = 0
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__db.execute('CREATE TABLE IF NOT EXISTS events ('
+                          'customer_id TEXT NOT NULL, '
+                          'event_id TEXT NOT NULL, '
+                          'stored REAL NOT NULL, '
+                          'accessed REAL NOT NULL, '
+                          'data BLOB NOT NULL, '
+                          'PRIMARY KEY (customer_id, event_id))')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS events_accessed ON events (accessed)')
+        self.__db.commit()
+        self.evict()
+
+    def get(self, customer_id, event_id):
+        key = self.key(customer_id, event_id)
+        with self.__lock:
+            row = self.__db.execute('SELECT stored, data FROM events WHERE customer_id = ? AND event_id = ?',
+                                    key).fetchone()
+            if row is None:
+                return None
+            if self.max_age is not None and time.time() - row[0] > self.max_age:
+                return None
+            self.__db.execute('UPDATE events SET accessed = ? WHERE customer_id = ? AND event_id = ?',
+                              (time.time(),) + key)
+            self.__db.commit()
+        return cPickle.loads(zlib.decompress(str(row[1])))
+
+    def put(self, customer_id, event_id, event_data):
+        key = self.key(customer_id, event_id)
+        data = sqlite3.Binary(zlib.compress(cPickle.dumps(event_data, cPickle.HIGHEST_PROTOCOL)))
+        now = time.time()
+        with self.__lock:
+            self.__db.execute('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?)', key + (now, now, data))
+            self.__db.commit()
+            self.__puts += 1
+            evict = self.__puts % self.evict_interval == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """ Removes expired entries and the least recently used entries beyond max_entries """
+        with self.__lock:
+            if self.max_age is not None:
+                self.__db.execute('DELETE FROM events WHERE stored < ?', (time.time() - self.max_age,))
+            self.__db.execute('DELETE FROM events WHERE rowid IN '
+                              '(SELECT rowid FROM events ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                              (self.max_entries,))
+            self.__db.commit()
+
+    def __len__(self):
+        with self.__lock:
+            return self.__db.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+
+class SignatureCache(object):
+    """ Thread-safe LRU cache of signature details keyed by sig_id, shared by every Event in the process. Entries
+        expire after ttl seconds (None never expires). Concurrent lookups of the same missing sig_id are coalesced
+        so that only one thread fetches the signature page while the others wait for its result. If path is set,
+        entries are loaded from it on creation and written back by save() so the cache persists across runs.
+    """
+
+    def __init__(self, max_entries=1024, ttl=86400, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0       # lookups which waited on another thread's fetch
+        self.__entries = OrderedDict()  # sig_id: (time stored, sig_details)
+        self.__in_flight = {}           # sig_id: [threading.Event, sig_details]
+        self.__lock = threading.Lock()
+        if path is not None:
+            self.load()
+
+    def get(self, sig_id):
+        """ Returns the cached details for sig_id, or None without fetching """
+        sig_id = str(sig_id)
+        with self.__lock:
+            entry = self.__entries.get(sig_id)
+            if entry is None or (self.ttl is not None and time.time() - entry[0] > self.ttl):
+                return None
+            return dict(entry[1])
+
+    def get_or_fetch(self, sig_id, fetch, deadline=None):
+        """ Returns the cached details for sig_id, otherwise calls fetch() once for all concurrent callers. Only dict
+            results are cached; anything else is returned but not stored. With a deadline (see deadline.py), a caller
+            waiting for the fetch of another raises its error once it expires.
+        """
+        sig_id = str(sig_id)
+        with self.__lock:
+            entry = self.__entries.pop(sig_id, None)
+            if entry is not None and (self.ttl is None or time.time() - entry[0] <= self.ttl):
+                self.__entries[sig_id] = entry
+                self.hits += 1
+                return dict(entry[1])
+            flight = self.__in_flight.get(sig_id)
+            if flight is None:
+                flight = self.__in_flight[sig_id] = [threading.Event(), None]
+                owner = True
+                self.misses += 1
+            else:
+                owner = False
+                self.coalesced += 1
+        if not owner:
+            wait_event(flight[0], deadline)
+            if flight[1] is None:
+                return fetch()  # the owning fetch raised; let this caller surface its own error
+            return dict(flight[1]) if isinstance(flight[1], dict) else flight[1]
+        try:
+            flight[1] = fetch()
+        finally:
+            with self.__lock:
+                if isinstance(flight[1], dict):
+                    self.__entries[sig_id] = (time.time(), flight[1])
+                    while len(self.__entries) > self.max_entries:
+                        self.__entries.popitem(last=False)
+                del self.__in_flight[sig_id]
+            flight[0].set()
+        return dict(flight[1]) if isinstance(flight[1], dict) else flight[1]
+
+    def stats(self):
+        with self.__lock:
+            stats = {
+                'entries': len(self.__entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced
+                }
+        return stats
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def load(self):
+        """ Loads unexpired entries from path, if it exists """
+        try:
+            with open(self.path, 'rb') as f:
+                entries = cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            return
+        now = time.time()
+        with self.__lock:
+            for sig_id, entry in entries:
+                if self.ttl is None or now - entry[0] <= self.ttl:
+                    self.__entries[sig_id] = entry
+
+    def save(self):
+        """ Writes the cache to path (atomically replacing the previous file) """
+        if self.path is None:
+            raise ValueError('SignatureCache has no path to save to')
+        with self.__lock:
+            entries = self.__entries.items()
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            cPickle.dump(entries, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self.path)
@@ -0,0 +1,251 @@
+""" The alapi command: bulk retrieval of incidents or events into a streaming export (see export.py). IDs are read from
+    files or stdin, completed IDs are checkpointed so an interrupted run carries on where it stopped, and throughput
+    statistics are printed to stderr while it runs.
+
+    alapi events -c 12345 event_ids.txt -o events.ndjson --checkpoint events.done
+    cat incident_ids.txt | alapi incidents -o incidents.csv --workers 20 --cache events.db
+"""
+
+import argparse
+import getpass
+import os
+import sys
+import threading
+import time
+from collections import deque
+from alapi import iter_events, get_incidents, set_event_cache, AlertLogic
+from cache import SqliteEventCache
+from events import EventFailure
+from export import EventExporter, FORMATS
+from instrument import add_hook, remove_hook, MetricsCollector
+from pool import WorkerPool, DEFAULT_HOST_LIMITS, CONSOLE_HOST
+
+
+LATENCY_SAMPLES = 10000  # latencies kept for the percentiles
+
+
+def read_ids(paths):
+    """ Yields the IDs from the files (whitespace or comma separated; '#' starts a comment); '-' or none is stdin """
+    for path in paths or ['-']:
+        f = sys.stdin if path == '-' else open(path)
+        for line in f:
+            for item in line.split('#', 1)[0].replace(',', ' ').split():
+                yield item
+        if f is not sys.stdin:
+            f.close()
+
+
+class Checkpoint(object):
+    """ File of completed IDs, one per line. IDs are added once the output they belong to has been flushed """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.done.update(line.strip() for line in f if line.strip())
+        self.f = open(path, 'a') if path is not None else None
+
+    def add(self, ids):
+        self.done.update(ids)
+        if self.f is not None:
+            self.f.writelines('{0}\n'.format(i) for i in ids)
+            self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+
+
+class RunStats(object):
+    """ Counts retrieved events and reports events/sec, bytes/sec, latency percentiles and cache hit rates """
+
+    def __init__(self):
+        self.started = time.time()
+        self.events = 0
+        self.failures = 0
+        self.bytes = 0
+        self.cached = 0       # events served by the event cache (no page request)
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.__lock = threading.Lock()
+
+    def add(self, event):
+        with self.__lock:
+            if isinstance(event, EventFailure):
+                self.failures += 1
+                return
+            self.events += 1
+            if not event.attempts:
+                self.cached += 1
+                return
+            self.bytes += sum(attempt.get('bytes', 0) for attempt in event.attempts)
+            self.latencies.append(sum(attempt['elapsed'] + attempt['delay'] for attempt in event.attempts))
+
+    def add_failures(self, count):
+        with self.__lock:
+            self.failures += count
+
+    @staticmethod
+    def percentile(latencies, fraction):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+    def report(self):
+        with self.__lock:
+            elapsed = max(time.time() - self.started, 1e-6)
+            latencies = sorted(self.latencies)
+            events, failures, cached, downloaded = self.events, self.failures, self.cached, self.bytes
+        signatures = AlertLogic.signature_cache.stats()
+        signature_hits = signatures['hits'] + signatures['coalesced']
+        signature_lookups = signature_hits + signatures['misses']
+        return ('{0} events ({1} failed) | {2:.1f} events/s | {3:.1f} KB/s | latency p50 {4:.3f}s p90 {5:.3f}s '
+                'p99 {6:.3f}s | event cache {7:.0%} | signature cache {8:.0%}'.format(
+                    events, failures, events / elapsed, downloaded / elapsed / 1024,
+                    self.percentile(latencies, 0.5), self.percentile(latencies, 0.9),
+                    self.percentile(latencies, 0.99), float(cached) / events if events else 0,
+                    float(signature_hits) / signature_lookups if signature_lookups else 0))
+
+
+class StatsPrinter(threading.Thread):
+    """ Prints RunStats.report() to stderr every interval seconds until stopped """
+
+    def __init__(self, stats, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.stats = stats
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            sys.stderr.write('\r{0}'.format(self.stats.report()))
+            sys.stderr.flush()
+
+    def stop(self):
+        self.stopped.set()
+        sys.stderr.write('\r{0}\n'.format(self.stats.report()))
+
+
+def batches(ids, size):
+    batch = []
+    for item in ids:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def fetch_events(args, credentials, pool, exporter, checkpoint, stats):
+    """ Returns the number of events which failed """
+    failed = 0
+    for batch in batches((i for i in read_ids(args.ids) if i not in checkpoint.done), args.batch):
+        completed = []
+        for event in iter_events(batch, args.customer_id, credentials[0], credentials[1], pool=pool):
+            stats.add(event)
+            exporter.write_event(event)
+            if not isinstance(event, EventFailure):
+                completed.append(event.event_id)
+        exporter.flush()
+        checkpoint.add(completed)  # failed events are retried by the next run
+        failed += len(batch) - len(completed)
+    return failed
+
+
+def fetch_incidents(args, credentials, pool, exporter, checkpoint, stats):
+    """ Returns the number of incidents which failed; an incident is only written (and checkpointed) once all of its
+        events were retrieved, so the next run retrieves the others again in full
+    """
+    failed = 0
+    for batch in batches((i for i in read_ids(args.ids) if i not in checkpoint.done), args.batch):
+        incidents = get_incidents(batch, args.customer_id, credentials[2], credentials[0], credentials[1], pool=pool)
+        incidents.retry_failed()
+        completed = []
+        for incident_id, incident in incidents.items():
+            if incident.failures:
+                stats.add_failures(len(incident.failures))
+                continue
+            for event in incident.Events.values():
+                stats.add(event)
+            exporter.write_incident(incident)
+            completed.append(incident_id)
+        stats.add_failures(len(incidents.failures))
+        exporter.flush()
+        checkpoint.add(completed)
+        failed += len(batch) - len(completed)
+    return failed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='alapi', description='Bulk retrieval of Alert Logic incidents and events')
+    parser.add_argument('mode', choices=('incidents', 'events'), help='type of the IDs read')
+    parser.add_argument('ids', nargs='*', help="files of IDs; stdin if none or '-'")
+    parser.add_argument('-c', '--customer-id', help='customer ID (required for events; default all children)')
+    parser.add_argument('-u', '--username', default=os.environ.get('ALAPI_USERNAME'),
+                        help='console username (default $ALAPI_USERNAME)')
+    parser.add_argument('-p', '--password', default=os.environ.get('ALAPI_PASSWORD'),
+                        help='console password (default $ALAPI_PASSWORD, otherwise prompted)')
+    parser.add_argument('-k', '--api-key', default=os.environ.get('ALAPI_API_KEY'),
+                        help='incident API key (default $ALAPI_API_KEY)')
+    parser.add_argument('-o', '--output', default='-', help='output file; stdout (NDJSON) by default')
+    parser.add_argument('-f', '--format', choices=FORMATS, help='output format; default from the output extension')
+    parser.add_argument('--payload-file', help='write the payload bytes to this file instead of the rows')
+    parser.add_argument('-w', '--workers', type=int, default=10, help='concurrent page requests (default 10)')
+    parser.add_argument('--batch', type=int, default=200, help='IDs per checkpointed batch (default 200)')
+    parser.add_argument('--checkpoint', help='file of completed IDs; an interrupted run resumes from it')
+    parser.add_argument('--cache', help='SQLite event cache file')
+    parser.add_argument('--stats-interval', type=float, default=2, help='seconds between statistics (0 disables)')
+    parser.add_argument('--stage-timings', action='store_true', help='print the time spent in each stage at the end')
+    args = parser.parse_args(argv)
+    if args.mode == 'events' and args.customer_id is None:
+        parser.error('events require --customer-id')
+    if args.mode == 'incidents' and args.api_key is None:
+        parser.error('incidents require --api-key (or $ALAPI_API_KEY)')
+    if args.username is None:
+        parser.error('--username (or $ALAPI_USERNAME) is required')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    password = args.password if args.password is not None else getpass.getpass('Alert Logic password: ')
+    if args.cache is not None:
+        set_event_cache(SqliteEventCache(args.cache))
+    host_limits = dict(DEFAULT_HOST_LIMITS)
+    host_limits[CONSOLE_HOST] = args.workers
+    AlertLogic().reset_requests_session(host_limits)  # a pooled connection for every worker
+    pool = WorkerPool(max_workers=args.workers, host_limits=host_limits)
+    checkpoint = Checkpoint(args.checkpoint)
+    exporter = EventExporter(args.output, args.format, payload_path=args.payload_file,
+                             append=bool(checkpoint.done) and args.output != '-')
+    stats = RunStats()
+    timings = MetricsCollector() if args.stage_timings else None
+    if timings is not None:
+        add_hook(timings)
+    printer = StatsPrinter(stats, args.stats_interval)
+    if args.stats_interval > 0:
+        printer.start()
+    fetch = fetch_events if args.mode == 'events' else fetch_incidents
+    try:
+        failed = fetch(args, (args.username, password, args.api_key), pool, exporter, checkpoint, stats)
+    except KeyboardInterrupt:
+        exporter.discard()  # the rows of the batch which was not checkpointed are written again by the next run
+        sys.stderr.write('\nInterrupted; rerun with the same --checkpoint to resume\n')
+        return 1
+    finally:
+        exporter.close()
+        checkpoint.close()
+        printer.stop()
+        if timings is not None:
+            remove_hook(timings)
+            sys.stderr.write('{0}\n'.format(timings))
+    if failed:
+        sys.stderr.write('{0} {1} failed; rerun with the same --checkpoint to retry them\n'.format(failed, args.mode))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+""" Per-tenant sessions. A Client bundles one set of credentials with its own pooled requests session and log-in
+    state, so Events and Incidents of many customers can be retrieved in parallel in one process without touching the
+    class level credentials of AlertLogic. A SessionManager hands out one Client per credential set, keeps their
+    sessions logged in between calls and closes the least recently used ones once too many are open or they sit idle.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+import transport
+from alertlogic import AlertLogic, login, session_expired
+from deadline import acquire_lock
+
+
+class Client(object):
+    """ Credentials, session and log-in state of one tenant. Pass it as client= to Event, Incident or the alapi
+        helpers. The fetcher (rate limits and retries, see retry.py) defaults to the shared AlertLogic.fetcher.
+    """
+
+    def __init__(self, username, password, api_key=None, pool_sizes=None, fetcher=None):
+        self.username = username
+        self.password = password
+        self.api_key = api_key
+        self.session = transport.new_session(pool_sizes)
+        self.fetcher = fetcher
+        self.logged_in = False
+        self.login_generation = 0    # incremented by every log-in; see AlertLogic.relogin
+        self.last_used = time.time()
+        self.__login_lock = threading.Lock()
+
+    def login(self, deadline=None):
+        login(self.session, self.username, self.password, deadline)
+        self.login_generation += 1
+        self.logged_in = True
+
+    def ensure_logged_in(self, deadline=None):
+        """ Logs in unless already logged in; concurrent callers wait for a single log-in (until the deadline) """
+        if self.logged_in:
+            return
+        acquire_lock(self.__login_lock, deadline)
+        try:
+            if not self.logged_in:
+                self.login(deadline)
+        finally:
+            self.__login_lock.release()
+
+    def relogin(self, generation, deadline=None):
+        """ Logs in again after the session expired, unless another thread already did since generation """
+        acquire_lock(self.__login_lock, deadline)
+        try:
+            if self.login_generation == generation:
+                self.logged_in = False
+                self.login(deadline)
+        finally:
+            self.__login_lock.release()
+
+    def get_fetcher(self):
+        return self.fetcher if self.fetcher is not None else AlertLogic.fetcher
+
+    def console_get(self, url, attempts=None, **kwargs):
+        """ GETs a console page with this client's session, logging in again once if the session expired """
+        self.last_used = time.time()
+        self.ensure_logged_in(kwargs.get('deadline'))
+        generation = self.login_generation
+        r = self.get_fetcher().get(self.session, url, attempts=attempts, **kwargs)
+        if session_expired(r):
+            self.relogin(generation, kwargs.get('deadline'))
+            r = self.get_fetcher().get(self.session, url, attempts=attempts, **kwargs)
+        return r
+
+    def connection_stats(self):
+        return transport.connection_stats(self.session)
+
+    def close(self):
+        """ Closes the pooled connections; the client logs in again if it is used afterwards """
+        self.logged_in = False
+        self.session.close()
+
+
+class SessionManager(object):
+    """ Thread-safe registry of one Client per (username, password). At most max_clients are kept; the least recently
+        used client is closed to make room for a new one, and clients unused for idle_timeout seconds (None keeps
+        them) are closed as well. The api_key of a known client is updated when a new one is given.
+    """
+
+    def __init__(self, max_clients=32, idle_timeout=900, pool_sizes=None, fetcher=None):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.pool_sizes = pool_sizes
+        self.fetcher = fetcher
+        self.__clients = OrderedDict()  # (username, password): Client, least recently used first
+        self.__lock = threading.Lock()
+
+    def client(self, username, password, api_key=None):
+        """ Returns the Client for the credentials, creating it if needed """
+        key = (username, password)
+        with self.__lock:
+            client = self.__clients.pop(key, None)
+            if client is None:
+                client = Client(username, password, api_key, pool_sizes=self.pool_sizes, fetcher=self.fetcher)
+            elif api_key is not None:
+                client.api_key = api_key
+            client.last_used = time.time()
+            self.__clients[key] = client
+            evicted = self.__evict()
+        for old_client in evicted:
+            old_client.close()
+        return client
+
+    def evict_idle(self):
+        """ Closes the clients which have been idle for longer than idle_timeout """
+        with self.__lock:
+            evicted = self.__evict()
+        for old_client in evicted:
+            old_client.close()
+
+    def __evict(self):
+        evicted = []
+        while len(self.__clients) > self.max_clients:
+            evicted.append(self.__clients.popitem(last=False)[1])
+        if self.idle_timeout is not None:
+            now = time.time()
+            for key, client in self.__clients.items():
+                if now - client.last_used > self.idle_timeout:
+                    evicted.append(self.__clients.pop(key))
+        return evicted
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__clients)
+
+    def close(self):
+        with self.__lock:
+            clients = self.__clients.values()
+            self.__clients.clear()
+        for client in clients:
+            client.close()
@@ -0,0 +1,91 @@
+""" Overall deadlines and cancellation of the fan-out fetches. A Deadline is passed as deadline= to get_events,
+    get_incidents, Incident and the WorkerPool: once it expires (or cancel() is called from any thread) no further
+    request is started, running requests have their timeouts cut to the time that was left, and the caller gets back
+    what finished with the rest as DeadlineExceededError (or CancelledError) failures.
+"""
+
+import threading
+import time
+from errors import DeadlineExceededError, CancelledError
+from transport import DEFAULT_TIMEOUT
+
+
+MIN_TIMEOUT = 0.001  # requests treats a timeout of 0 as invalid
+WAIT_INTERVAL = 0.01  # seconds between the checks of a deadline while waiting for a lock or event
+
+
+class Deadline(object):
+    """ Expires seconds from now (None never expires, so the deadline is only cancelled explicitly) """
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.expires = time.time() + seconds if seconds is not None else None
+        self.__cancelled = threading.Event()
+
+    def cancel(self):
+        """ Stops the work using this deadline as if it had expired """
+        self.__cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self.__cancelled.is_set()
+
+    def remaining(self):
+        """ Seconds left, or None without an expiry time """
+        if self.expires is None:
+            return None
+        return max(self.expires - time.time(), 0.0)
+
+    def expired(self):
+        """ True once the deadline passed or it was cancelled """
+        return self.__cancelled.is_set() or (self.expires is not None and time.time() >= self.expires)
+
+    def error(self):
+        """ The exception for work which did not finish in time """
+        if self.cancelled:
+            return CancelledError('The fetch was cancelled')
+        return DeadlineExceededError('The deadline of {0} seconds passed'.format(self.seconds))
+
+    def check(self):
+        """ Raises error() if the deadline expired """
+        if self.expired():
+            raise self.error()
+
+    def timeout(self, timeout=None):
+        """ Returns the requests timeout (seconds or a (connect, read) tuple; None is transport.DEFAULT_TIMEOUT) cut to
+            the time remaining
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        timeout = timeout if timeout is not None else DEFAULT_TIMEOUT
+        remaining = max(remaining, MIN_TIMEOUT)
+        if isinstance(timeout, tuple):
+            return tuple(min(part, remaining) if part is not None else remaining for part in timeout)
+        return min(timeout, remaining)
+
+
+def as_deadline(deadline):
+    """ Returns a Deadline for deadline, which is None (no deadline), seconds from now or a Deadline """
+    if deadline is None or isinstance(deadline, Deadline):
+        return deadline
+    return Deadline(deadline)
+
+
+def acquire_lock(lock, deadline=None):
+    """ Acquires lock; with a deadline, raises its error instead once it expires (Python 2 locks have no timeout) """
+    if deadline is None:
+        lock.acquire()
+        return
+    while not lock.acquire(False):
+        deadline.check()
+        time.sleep(WAIT_INTERVAL)
+
+
+def wait_event(event, deadline=None):
+    """ Waits for the threading.Event to be set; with a deadline, raises its error instead once it expires """
+    if deadline is None:
+        event.wait()
+        return
+    while not event.wait(WAIT_INTERVAL):
+        deadline.check()
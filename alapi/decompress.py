@@ -0,0 +1,122 @@
+""" In-memory decompression of compressed HTTP bodies found in a reassembled packet payload. Captured payloads are
+    often cut off part way through the body, so decompression keeps whatever could be recovered from a truncated
+    stream instead of failing, and the output is capped to guard against gzip bombs. Multiple gzip members, deflate
+    bodies and chunked transfer encoding are handled as well.
+"""
+
+import zlib
+
+
+GZIP_MAGIC = '\x1f\x8b\x08'  # 1f8b08 - gzip signature with the deflate method
+HEADER_END = '\r\n\r\n'      # 0d0a0d0a - packet header delineation
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+MIN_GZIP_SIZE = 10           # per RFC1952, the gzip header must contain at least 10 bytes
+MAX_DECOMPRESSED_SIZE = 10 * 1024 * 1024
+BLOCK_SIZE = 4096            # input is fed in blocks so a corrupt block only loses its own output
+
+
+def dechunk(body):
+    """ Removes chunked transfer encoding from body; a truncated body returns the data up to the cut """
+    chunks = []
+    position = 0
+    while position < len(body):
+        line_end = body.find('\r\n', position)
+        if line_end == -1:
+            break
+        try:
+            size = int(body[position:line_end].split(';', 1)[0].strip(), 16)
+        except ValueError:
+            break
+        if size == 0:
+            break
+        start = line_end + 2
+        chunks.append(body[start:start + size])
+        position = start + size + 2
+    return ''.join(chunks)
+
+
+def find_compressed_body(payload):
+    """ Returns (wbits, data) for the first compressed body in the payload, or (None, '') if there is none. Header
+        blocks are checked for chunked transfer encoding and deflate content encoding; otherwise the first gzip
+        signature found is used.
+    """
+    block_start = 0
+    while True:
+        header_end = payload.find(HEADER_END, block_start)
+        if header_end == -1:
+            break
+        headers = payload[block_start:header_end].lower()
+        body = payload[header_end + len(HEADER_END):]
+        if 'transfer-encoding: chunked' in headers:
+            body = dechunk(body)
+        if body.startswith(GZIP_MAGIC):
+            return GZIP_WBITS, body
+        if 'content-encoding: deflate' in headers and len(body) >= 2:
+            if ord(body[0]) & 0x0f == 8 and (ord(body[0]) * 256 + ord(body[1])) % 31 == 0:
+                return zlib.MAX_WBITS, body   # zlib wrapped deflate
+            return -zlib.MAX_WBITS, body      # raw deflate
+        block_start = header_end + len(HEADER_END)
+    position = payload.find(GZIP_MAGIC)
+    if position == -1:
+        return None, ''
+    return GZIP_WBITS, payload[position:]
+
+
+def inflate(data, wbits=GZIP_WBITS, max_size=MAX_DECOMPRESSED_SIZE):
+    """ Decompresses data and returns (output, complete, capped). complete is False when the stream was truncated or
+        corrupt, in which case output holds everything recovered before that point. capped is True when the output
+        was cut at max_size. Consecutive gzip members are all decompressed.
+    """
+    output = []
+    size = 0
+    while data:
+        decompressor = zlib.decompressobj(wbits)
+        offset = 0
+        try:
+            while offset < len(data) and not decompressor.unused_data:
+                pending = data[offset:offset + BLOCK_SIZE]
+                offset += BLOCK_SIZE
+                while pending:
+                    chunk = decompressor.decompress(pending, max_size - size + 1)
+                    output.append(chunk)
+                    size += len(chunk)
+                    if size > max_size:
+                        return ''.join(output)[:max_size], False, True
+                    pending = decompressor.unconsumed_tail
+        except zlib.error:
+            return ''.join(output), False, False
+        if decompressor.unused_data:  # end of this member
+            data = decompressor.unused_data + data[offset:]
+            if wbits == GZIP_WBITS and data.startswith(GZIP_MAGIC):
+                continue
+            return ''.join(output), True, False
+        # zlib in python 2 does not expose eof; a byte fed past the end of a finished stream is left unused
+        probe = decompressor.copy()
+        try:
+            probe.decompress('\x00')
+        except zlib.error:
+            pass
+        if probe.unused_data:
+            return ''.join(output), True, False
+        output.append(decompressor.flush())
+        return ''.join(output), False, False
+    return ''.join(output), False, False
+
+
+def decompress_payload(payload, max_size=MAX_DECOMPRESSED_SIZE):
+    """ Detects and decompresses a compressed body in the payload and returns the annotated decompressed data, or ''
+        if no compressed data was found
+    """
+    wbits, data = find_compressed_body(payload)
+    if wbits is None:
+        return ''
+    decompressed_data = '\n[*] Decompressed data detected'
+    if wbits == GZIP_WBITS and len(data) <= MIN_GZIP_SIZE:
+        decompressed_data += '\n[!] Unable to decompress. Too much missing data\n'
+        return decompressed_data
+    output, complete, capped = inflate(data, wbits, max_size)
+    if capped:
+        decompressed_data += '\n[!] Decompressed data exceeds {0} bytes | Truncated\n\n'.format(max_size)
+    elif not complete:
+        decompressed_data += '\n[!] Missing zip data detected | Adding partial contents\n\n'
+    return decompressed_data + output
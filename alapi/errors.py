@@ -16,5 +16,26 @@ class CredentialsNotSet(AlApiError):
 class EventNotRetrievedError(AlApiError):
     """Failed to retrieve event; most often because of authentication"""
 
+
 class IncidentNotRetrievedError(AlApiError):
     """Failed to retrieve incident; most often because of authentication"""
+
+
+class HttpStatusError(NotAuthenticatedError):
+    """Raise when a page request returns a non 200 status; the status is kept as status_code"""
+
+    def __init__(self, message, status_code=None):
+        NotAuthenticatedError.__init__(self, message)
+        self.status_code = status_code
+
+
+class EventParseError(EventNotRetrievedError):
+    """The event page was retrieved but could not be parsed"""
+
+
+class DeadlineExceededError(AlApiError):
+    """The overall deadline of a fetch passed before this part of the work finished"""
+
+
+class CancelledError(DeadlineExceededError):
+    """The fetch was cancelled before this part of the work finished (see deadline.Deadline.cancel)"""
@@ -3,34 +3,45 @@
  """
 
 import binascii
-import time
-import gzip
-import subprocess
-import os
-import sys
 import re
 import pprint
-from string import printable
+import requests
 from HTMLParser import HTMLParser
 from alertlogic import *
+from pageparser import EventPageParser
+import hexdump
+import instrument
+from decompress import decompress_payload
 
 
 class Event(AlertLogic):
-    def __init__(self, event_id, customer_id, username=None, password=None):
+    __slots__ = ('event_id', 'customer_id', 'event_url', 'event_details', 'signature_details', 'event_payload',
+                 'attempts', 'client', 'deadline')
+    page_parser = EventPageParser()  # shared, stateless parser for the event pages
+
+    def __init__(self, event_id, customer_id, username=None, password=None, client=None, lazy=False, deadline=None):
         AlertLogic.__init__(self)
+        self.client = client         # Client (see client.py); None uses the class level credentials
+        self.deadline = deadline     # Deadline (see deadline.py) of the requests of this event, or None
         self.event_id = event_id
         self.customer_id = customer_id
         self.event_url = ''          # set in get_event
         self.event_details = {}      # dict; set in get_event
         self.signature_details = {}  # dict; set in get_event
         self.event_payload = ''      # object --> EventPayload  #TODO: capitalize object
-        if (self.username is None or self.password is None) and (username is not None and password is not None):
+        self.attempts = []           # list of dict; one per request of the event page (see retry.Fetcher)
+        if client is None and (self.username is None or self.password is None) and (username is not None and
+                                                                                     password is not None):
             AlertLogic.set_credentials(self, username, password)
-        if self.username is not None and self.password is not None:
-            if self.al_logged_in is False:
-                self.login_al()
+        if self.has_credentials() and not lazy:
             self.get_event()         # triggers process to create this object
 
+    def __getstate__(self):
+        """ The client and deadline are runtime handles (holding locks and sessions) and are not pickled """
+        state = AlertLogic.__getstate__(self)
+        state.update(client=None, deadline=None)
+        return state
+
     def __str__(self):
         pp = pprint.PrettyPrinter(indent=4)
         to_string = ('Event ID: {0}\n'
@@ -54,23 +65,57 @@ class Event(AlertLogic):
             }
         return to_json
 
+    def to_cache(self):
+        """ Returns the parsed fields of this event as stored by an EventCache """
+        to_cache = {
+            'event_url': self.event_url,
+            'event_details': self.event_details,
+            'signature_details': self.signature_details,
+            'payload': self.event_payload.payload,
+            'packet_details': self.event_payload.packet_details.to_json()
+            }
+        return to_cache
+
+    def load_cached(self, cached):
+        """ Sets this event from the dict returned by to_cache """
+        self.event_url = cached['event_url']
+        self.event_details = cached['event_details']
+        self.signature_details = cached['signature_details']
+        if 'payload' in cached:
+            payload = cached['payload']
+        else:
+            payload = binascii.unhexlify(cached['raw_hex'])  # entries cached before the payload was kept as bytes
+        self.event_payload = EventPayload(payload, cached['packet_details'])
+
     def __get_signature_details(self, sig_id, raw_sig=None):
-        """ Retrieves signature detail from the sid_id specified page """
-        parse_html = HTMLParser()
-        sig_rule = 'none_parsed'
+        """ Retrieves signature detail from the sid_id specified page, unless the rule was included in the event page.
+            Fetched pages go through the shared signature cache, so each sig_id is only downloaded once.
+        """
+        started = instrument.timer()
         if raw_sig is None:
-            sig_url = 'https://console.clouddefender.alertlogic.com/signature.php?sid={0}'.format(sig_id)
-            r = AlertLogic.alogic.get(sig_url)
-            if r.status_code != 200:
-                return 'Failed to retrieve signature details :('
-            # logic for info
-            sig_details_search = re.search('<th>Signature\sContent</th>[\s\n]+<td>(?P<sig_rule>.*?)</td>', r.text, re.DOTALL)
-            sig_rule_dirty = ''
-            if sig_details_search is not None:
-                sig_rule_dirty = sig_details_search.group('sig_rule')
+            signature_details = AlertLogic.signature_cache.get_or_fetch(
+                sig_id, lambda: self.__fetch_signature_details(sig_id), deadline=self.deadline)
         else:
-            sig_rule_dirty = raw_sig
             # TODO: this version always includes escaped quotes (\") even with hmtl removal; needs to be removed!
+            signature_details = self.__clean_signature_details(sig_id, raw_sig)
+        instrument.record('signature', started)
+        return signature_details
+
+    def __fetch_signature_details(self, sig_id):
+        sig_url = 'https://console.clouddefender.alertlogic.com/signature.php?sid={0}'.format(sig_id)
+        r = self.console_get(sig_url, deadline=self.deadline)
+        if r.status_code != 200:
+            raise HttpStatusError('Failed to retrieve signature details of #{0} for event #{1}. Status code: {2}. '
+                                  'Reason: {3}'.format(sig_id, self.event_id, r.status_code, r.reason), r.status_code)
+        # logic for info
+        sig_details_search = re.search('<th>Signature\sContent</th>[\s\n]+<td>(?P<sig_rule>.*?)</td>', r.text, re.DOTALL)
+        sig_rule_dirty = ''
+        if sig_details_search is not None:
+            sig_rule_dirty = sig_details_search.group('sig_rule')
+        return self.__clean_signature_details(sig_id, sig_rule_dirty)
+
+    def __clean_signature_details(self, sig_id, sig_rule_dirty):
+        parse_html = HTMLParser()
         try:
             sig_rule = parse_html.unescape(sig_rule_dirty).replace('<br />', '')
         except Exception:
@@ -81,222 +126,242 @@ class Event(AlertLogic):
             }
         return sig_details
 
-    def __packet_analysis(self, payload):
-        """ Extracts information from the provided payload and returns the JSON annotated below
-        :param payload (str):
-        :return: JSON
+    def get_event(self):
         """
-        restful_call = 'none_parsed'
-        protocol = 'none_parsed'
-        host = 'none_parsed'
-        resource = 'non_parsed'
-        response_code = 'none_parsed'
-        response_message = 'none_parsed'
-        # request
-        rex_request = re.search(
-            '(?P<restful_call>GET|POST|HEAD|TRACE|PUT)\s(?P<resource>[\S.]*)\s(?P<protocol>\S*)', payload)
-        if rex_request:
-            restful_call = rex_request.group('restful_call')             # GET
-            resource = rex_request.group('resource')                     # /admin/blah
-            protocol = rex_request.group('protocol')                     # HTTP/1.1
-        rex_host = re.search('host:\s(?P<host>[\w\.-]*)', payload, re.I)  # www.example.com
-        if rex_host:
-            host = rex_host.group('host')
-        # response
-        rex_response = re.search('^HTTP/[\d\.]+\s(?P<code>\d{3})\s(?P<message>[\w ]*)', payload, re.M)
-        if rex_response:
-            response_code = rex_response.group('code')                   # 302
-            response_message = rex_response.group('message')             # Found
-        packet_details = {
-            'request_packet': {
-                'restful_call':     restful_call,
-                'protocol':         protocol,
-                'host':             host,
-                'resource':         resource,
-                'full_url':         host + resource
-                },
-            'response_packet': {
-                'response_code':    response_code,
-                'response_message': response_message
-                }
-            }
-        return packet_details
-
-    def __gz_handler(self, event_id, converted_hex):
-        """ Detects and decompresses gzipped hex """
-        #TODO: make this public for use with the raw interactive methods????
-        hold_hex = ''
-        hold_bin = ''
-        decompressed_data = '\n[*] Decompressed data detected'
-        if '0d0a0d0a1f8b08' in converted_hex:  # 0d0a0d0a-packet header delineation, 1f8b08-gz signature
-            hold_hex = converted_hex[converted_hex.find('0d0a0d0a1f8b08') + 8:]
-        elif '1f8b08' in converted_hex:
-            hold_hex = converted_hex[converted_hex.find('1f8b08'):]
-        else:
-            return ''
-        if len(hold_hex) <= 20:  # per RFC1952, gzip header must contain at least 10 bytes (20 hex characters)
-            decompressed_data += '\n[!] Unable to decompress. Too much missing data\n'
-            return decompressed_data
-        try:
-            hold_bin = binascii.a2b_hex(hold_hex)
-        except TypeError:
-            decompressed_data += '\n[!] Potential zipped data detected but unable to convert - check event'
-            return decompressed_data
-        #############################################
-        # TODO: Possibly implement
-        #############################################
-        #gz_handler = gzip.GzipFile(fileobj=hold_bin)
-        #try:
-            #decompressed_data += gz_handler.read()
-            #return decompressed_data
-        #############################################
-        if sys.platform != 'linux2':
-            decompressed_data += '\nCurrently only able to decompress data on linux...\n'  #TODO: temp fix
-            return decompressed_data
-        tmp_file_name = '/tmp/{0}_{1}.tmp'.format(event_id, time.time())  # unique name prevents overriding with threads
-        with open(tmp_file_name, 'wb') as outfile:
-            outfile.write(hold_bin)
+            Retrieves the event page, parses some descriptive fields for metadata, and cleans up then reconstructs
+            the payload data. If an event cache is set, it is checked first and the parsed event is stored in it.
+        """
+        if self.load_from_cache():
+            return
+        page = self.fetch_page()
         try:
-            with gzip.open(tmp_file_name, 'rb') as f:
-                decompressed_data += f.read()
+            parsed = parse_event_page(page)
         except Exception as e:
-            decompressed_data += '\n[!] Missing zip data detected | Adding partial contents\n\n'
-            output = subprocess.Popen(["zcat", tmp_file_name], stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
-            if output is None:
-                # log error message with output[1]
-                decompressed_data += '\n[!] Something went wrong with zcat output - check event\n'
-            else:
-                decompressed_data += output[0]
-        if os.path.exists(tmp_file_name):
-            os.remove(tmp_file_name)
-        # would be really awesome to be able to decompress incomplete with zlib instead of fooling with zcat
-        # return zlib.decompress(hold_bin, 16+zlib.MAX_WBITS)
-        #
-        # The code below was replaced to prevent non-printable characters from returning
-        #return decompressed_data  #TODO: remove if tests work fine
-        ascii_decompressed_data = decompressed_data.decode('ascii', 'ignore')
-        printable_ascii_compressed_data = ''.join([c for c in ascii_decompressed_data if c in printable])
-        return printable_ascii_compressed_data
+            raise EventParseError('Failed to parse event #{0}. {1}: {2}'.format(self.event_id, type(e).__name__, e))
+        self.load_parsed(parsed)
 
-    def get_event(self):
-        """
-            Retrieves the event page, parses some descriptive fields for metadata, and cleans up then reconstructs
-            the payload data. Returns
+    def load_from_cache(self):
+        """ Sets this event from the event cache; returns False if there is no cache or the event is not in it (or was
+            cached with a failure message for its signature details by an older version)
         """
-        full_event = {}
-        signature_details = {}
-        source_address = 'none_parsed'
-        dest_address = 'none_parsed'
-        source_port = 'none_parsed'
-        dest_port = 'none_parsed'
-        signature_name = 'none_parsed'
-        sensor = 'none_parsed'
-        protocol = 'none_parsed'
-        classification = 'none_parsed'
-        severity = 'none_parsed'
-        event_time = 'none_parsed'
-        decompressed = ''
-        packet_details = ''
+        if AlertLogic.event_cache is None:
+            return False
+        cached = AlertLogic.event_cache.get(self.customer_id, self.event_id)
+        if cached is None or not isinstance(cached['signature_details'], dict):
+            return False
+        self.load_cached(cached)
+        return True
+
+    def get_event_url(self):
         event_id = str(self.event_id)
         customer_id = str(self.customer_id)
         screen = 'event_monitor'
         filter_id = '0'
         event_url = 'https://console.clouddefender.alertlogic.com/event.php?id={0}&customer_id={1}&screen={2}&filter_id={3}'.format(
             event_id, customer_id, screen, filter_id)
-        self.event_url = event_url  # set global url
-        r = AlertLogic.alogic.get(event_url, allow_redirects=False)  #TODO: add exception handling around for requests.exceptions
+        return event_url
+
+    def fetch_page(self):
+        """ Downloads and returns the event page (str); the network half of get_event. If a page archive is set, the
+            page is added to it
+        """
+        self.event_url = self.get_event_url()  # set global url
+        started = instrument.timer()
+        r = self.console_get(self.event_url, attempts=self.attempts, allow_redirects=False, deadline=self.deadline)
+        if started is not None:
+            transferred, retries = instrument.attempt_totals(self.attempts)
+            instrument.record('download', started, bytes=transferred, retries=retries)
         if r.status_code != 200:
-            raise NotAuthenticatedError('Failed to retrieve event #{0}. Status code: {1}. Reason: {2}'.format(
-                event_id, r.status_code, r.reason))
-        tmp_raw_page = str(r.text)
-        ###################################################################
-        # REGEX Event Details
-        ###################################################################
-        rex = re.compile(
-            "\s*var source_addr = '(?P<source_address>.+)';\s*\n" +
-            "\s*var dest_addr = '(?P<dest_address>.+)';\s*\n" +
-            "\s*var source_port = '(?P<source_port>.+)';\s*\n" +
-            "\s*var dest_port = '(?P<dest_port>.+)';\s*\n" +
-            "\s*var signature_name = '(?P<signature_name>.+)';\s*\n" +
-            "\s*var sensor = '(?P<sensor>.+)';\s*\n" +
-            "\s*var protocol = '(?P<protocol>.+)';\s*\n" +
-            "\s*var classification = '(?P<classification>.+)';\s*\n" +
-            "\s*var severity = '(?P<severity>.+)';\s*\n")
-        rex_results = rex.search(tmp_raw_page)
-        if rex_results:
-            source_address = rex_results.group('source_address')
-            dest_address = rex_results.group('dest_address')
-            source_port = rex_results.group('source_port')
-            dest_port = rex_results.group('dest_port')
-            signature_name = rex_results.group('signature_name')
-            sensor = rex_results.group('sensor')
-            protocol = rex_results.group('protocol')
-            classification = rex_results.group('classification')
-            severity = rex_results.group('severity')
-        #  sets details
-        details = {
-            'source_addr': source_address,
-            'dest_addr': dest_address,
-            'source_port': source_port,
-            'dest_port': dest_port,
-            'signature_name': signature_name,
-            'sensor': sensor,
-            'protocol': protocol,
-            'classification': classification,
-            'severity': severity
-            }
-        ###################################################################
-        # REGEX Signature Details
-        ###################################################################
-        sig_id_search = re.search('<strong><a\shref="/signature.php\?[\w=&]*sid=(?P<sig_id>\d+).+', tmp_raw_page)
-        sig_raw_search = re.search('<td>Signature\sContent:</td>[\s\n]+<td>(?P<sig_rule>.*?)</td>\s*', tmp_raw_page, re.DOTALL)
-        if sig_raw_search is not None and sig_id_search is not None:
-            signature_details = self.__get_signature_details(sig_id_search.group('sig_id'), sig_raw_search.group('sig_rule'))
-        elif sig_id_search is not None:
-            sig_id = sig_id_search.group('sig_id')
+            raise HttpStatusError('Failed to retrieve event #{0}. Status code: {1}. Reason: {2}. '
+                                  'Attempts: {3}'.format(self.event_id, r.status_code, r.reason, len(self.attempts)),
+                                  r.status_code)
+        page = str(r.text)
+        if AlertLogic.page_archive is not None:
+            AlertLogic.page_archive.put(self.customer_id, self.event_id, page)
+        return page
+
+    def load_parsed(self, parsed, fetch_signature=True):
+        """ Sets this event from the dict returned by parse_event_page, retrieving the signature details if the rule
+            was not on the event page, and stores the event in the event cache. Without fetch_signature, such a rule
+            is only taken from the signature cache (offline use, see archive.replay_events)
+        """
+        signature_details = {}
+        if parsed['sig_rule'] is not None and parsed['sig_id'] is not None:
+            signature_details = self.__get_signature_details(parsed['sig_id'], parsed['sig_rule'])
+        elif parsed['sig_id'] is not None and not fetch_signature:
+            signature_details = AlertLogic.signature_cache.get(parsed['sig_id'])
+            if signature_details is None:
+                signature_details = self.__clean_signature_details(parsed['sig_id'], '')
+        elif parsed['sig_id'] is not None:
             # TODO: this should break into its own thread that joins right before the full event {} assembly; maybe
-            signature_details = self.__get_signature_details(str(sig_id))  # for global signature details
-        ###################################################################
-        # engine time of event
-        ###################################################################
-        event_time_search = re.search(
-            '<td>Engine\sTime:</td>\s+<td><span\sclass="bold">(?P<event_time>.*?)</span></td>', tmp_raw_page)
-        if event_time_search is not None:
-            event_time = event_time_search.group('event_time')
-            details.update({'event_time': event_time})
-        ##################################################################
-        ##################################################################
-        #  The start and end parse are the most susceptible to breaking due to changes by Alert Logic!
-        start_parse = str(r.text).find('<td>Signature: ') - 18
-        end_parse = str(r.text).find('<table id="cache_table" style="display: none;">')
-        parsed_html = str(r.text[start_parse:end_parse])
-        raw_hex = ''
-        for line in parsed_html.splitlines(True):
-            hexstring = re.match(r'.*(0x[\da-f]{4}:[\s\da-f]+)\W', line.strip())
-            if hexstring is not None:
-                raw_hex += hexstring.string + '\n'
-        # print raw_hex  # preserve this to print raw hex formatted
-        raw2 = re.findall(r'(?<=0x[\da-fA_F]{4}:\s)\b[\da-fA-F]{2,4}\b|(?<=[\da-fA-F]{4}\s)\b[\da-fA-F]{2,4}\b', raw_hex)
-        raw3 = ''  # this is the TRUE raw hex of the packets
-        for chunk in raw2:
-            raw3 += chunk  # true raw hex!
-        full_payload1 = '{0}'.format(
-            raw3.decode('hex').decode('ascii', 'ignore'))  # what is lost with ignore vs 'replace'
-        full_payload = ''.join([c for c in full_payload1 if c in printable])
-        packet_details = self.__packet_analysis(full_payload)
-        decompressed = self.__gz_handler(event_id, raw3)
-        self.event_details = details
+            signature_details = self.__get_signature_details(parsed['sig_id'])  # for global signature details
+        self.event_details = parsed['details']
         self.signature_details = signature_details
-        self.event_payload = EventPayload(full_payload, decompressed, raw3, packet_details)
+        self.event_payload = EventPayload(parsed['payload'], parsed['packet_details'],
+                                          parsed.get('decompressed'))  # only the payload bytes are kept
+        if AlertLogic.event_cache is not None:
+            AlertLogic.event_cache.put(self.customer_id, self.event_id, self.to_cache())
+
+
+def parse_event_page(page, decompress=False):
+    """ Parses an event page into {'details', 'sig_id', 'sig_rule', 'payload', 'packet_details'} without any network
+        access, so it can also run in another process (see pipeline.py). With decompress, any compressed body is
+        decompressed up front and included as 'decompressed' rather than on first access of EventPayload.decompressed
+    """
+    started = instrument.timer()
+    parsed = Event.page_parser.parse(page)
+    # print parsed['raw_hex']  # preserve this to print raw hex formatted
+    payload = binascii.unhexlify(hexdump.raw_hex(parsed['raw_hex']))  # from the TRUE raw hex of the packets
+    page_fields = {
+        'details': parsed['details'],
+        'sig_id': parsed['sig_id'],
+        'sig_rule': parsed['sig_rule'],
+        'payload': payload,
+        'packet_details': packet_analysis(hexdump.printable_text(payload))
+        }
+    instrument.record('parse', started, bytes=len(page))
+    if decompress:
+        started = instrument.timer()
+        page_fields['decompressed'] = hexdump.printable_text(decompress_payload(payload))
+        instrument.record('decompress', started)
+    return page_fields
+
+
+def packet_analysis(payload):
+    """ Extracts information from the provided payload and returns the JSON annotated below
+    :param payload (str):
+    :return: JSON
+    """
+    restful_call = 'none_parsed'
+    protocol = 'none_parsed'
+    host = 'none_parsed'
+    resource = 'non_parsed'
+    response_code = 'none_parsed'
+    response_message = 'none_parsed'
+    # request
+    rex_request = re.search(
+        '(?P<restful_call>GET|POST|HEAD|TRACE|PUT)\s(?P<resource>[\S.]*)\s(?P<protocol>\S*)', payload)
+    if rex_request:
+        restful_call = rex_request.group('restful_call')             # GET
+        resource = rex_request.group('resource')                     # /admin/blah
+        protocol = rex_request.group('protocol')                     # HTTP/1.1
+    rex_host = re.search('host:\s(?P<host>[\w\.-]*)', payload, re.I)  # www.example.com
+    if rex_host:
+        host = rex_host.group('host')
+    # response
+    rex_response = re.search('^HTTP/[\d\.]+\s(?P<code>\d{3})\s(?P<message>[\w ]*)', payload, re.M)
+    if rex_response:
+        response_code = rex_response.group('code')                   # 302
+        response_message = rex_response.group('message')             # Found
+    packet_details = {
+        'request_packet': {
+            'restful_call':     restful_call,
+            'protocol':         protocol,
+            'host':             host,
+            'resource':         resource,
+            'full_url':         host + resource
+            },
+        'response_packet': {
+            'response_code':    response_code,
+            'response_message': response_message
+            }
+        }
+    return packet_details
+
+
+AUTH_STATUSES = (301, 302, 303, 307, 401, 403)  # the console redirects to its log-in page once a session is refused
+
+
+def failure_category(error):
+    """ Classifies the error of a failed retrieval as 'auth', 'http' (any other status), 'timeout', 'connection',
+        'parse', 'deadline', 'cancelled', 'credentials' (not set), 'not_retrieved' (other alapi errors) or 'other'
+    """
+    status_code = getattr(error, 'status_code', None)
+    if isinstance(error, CredentialsNotSet):
+        return 'credentials'
+    if isinstance(error, EventParseError):
+        return 'parse'
+    if isinstance(error, CancelledError):
+        return 'cancelled'
+    if isinstance(error, DeadlineExceededError):
+        return 'deadline'
+    if status_code in AUTH_STATUSES or (isinstance(error, NotAuthenticatedError) and status_code is None):
+        return 'auth'
+    if status_code is not None:
+        return 'http'
+    if isinstance(error, requests.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.RequestException):
+        return 'connection'
+    if isinstance(error, AlApiError):
+        return 'not_retrieved'
+    return 'other'
+
+
+class EventFailure(ALCommon):
+    """Yielded by the streaming methods (and kept in the failures of a FetchResult) in place of an Event which could
+    not be retrieved. category is the failure_category of the error, elapsed the seconds spent on the event if known"""
+    __slots__ = ('event_id', 'error_type', 'message', 'category', 'status_code', 'elapsed')
+
+    def __init__(self, event_id, error, elapsed=None):
+        self.event_id = event_id
+        self.error_type = type(error).__name__
+        self.message = str(error)
+        self.category = failure_category(error)
+        self.status_code = getattr(error, 'status_code', None)
+        self.elapsed = elapsed if elapsed is not None else getattr(error, 'elapsed', None)
+
+    def __str__(self):
+        to_string = ('Event ID: {0}\n'
+                     'Failed ({1}): {2}: {3}'.format(self.event_id, self.category, self.error_type, self.message))
+        return to_string
+
+    def to_json(self):
+        to_json = {
+            'event_id': self.event_id,
+            'error_type': self.error_type,
+            'message': self.message,
+            'category': self.category,
+            'status_code': self.status_code,
+            'elapsed': self.elapsed
+            }
+        return to_json
 
 
 class EventPayload(ALCommon):
-    """Belongs to events"""
-    def __init__(self, full, decompressed, raw, packet_details_json):
-        self.full_payload = full            # string
-        self.decompressed = decompressed    # string
-        self.raw_hex = raw                  # raw hex
+    """Belongs to events. Only the payload bytes are stored; the hex, printable and decompressed views are computed on
+    first access and then kept"""
+    __slots__ = ('payload', 'packet_details', '_raw_hex', '_full_payload', '_decompressed')
+
+    def __init__(self, payload, packet_details_json, decompressed=None):
+        self.payload = payload              # bytes of the packets
         self.packet_details = self.get_packet_details(packet_details_json)  #TODO: capitalize object
+        self._raw_hex = None
+        self._full_payload = None
+        self._decompressed = decompressed   # may be computed up front, e.g. by parse_event_page
+
+    @property
+    def raw_hex(self):
+        """ raw hex of the packets """
+        if self._raw_hex is None:
+            self._raw_hex = binascii.hexlify(self.payload)
+        return self._raw_hex
+
+    @property
+    def full_payload(self):
+        """ printable ascii of the packets """
+        if self._full_payload is None:
+            self._full_payload = hexdump.printable_text(self.payload)
+        return self._full_payload
+
+    @property
+    def decompressed(self):
+        """ printable ascii of any gzipped (or deflated) data in the packets, or '' """
+        if self._decompressed is None:
+            started = instrument.timer()
+            self._decompressed = hexdump.printable_text(decompress_payload(self.payload))
+            instrument.record('decompress', started)
+        return self._decompressed
 
     def __str__(self):
         to_string = ('Packet Details: \n{0}\n'
@@ -320,6 +385,8 @@ class EventPayload(ALCommon):
 
 class PacketDetails(ALCommon):
     """Belongs to EventPayload"""
+    __slots__ = ('request_packet', 'response_packet')
+
     def __init__(self, packet_details_json):
         self.request_packet = ''  # object --> RequestPacketDetails  #TODO: capitalize object
         self.response_packet = ''  # object --> ResponsePacketDetails  #TODO: capitalize object
@@ -346,6 +413,8 @@ class PacketDetails(ALCommon):
 
 class RequestPacketDetails(ALCommon):
     """Belongs to PacketDetails"""
+    __slots__ = ('restful_call', 'protocol', 'host', 'resource', 'full_url')
+
     def __init__(self, request_dict):
         self.restful_call = request_dict['restful_call']
         self.protocol = request_dict['protocol']
@@ -374,6 +443,8 @@ class RequestPacketDetails(ALCommon):
 
 class ResponsePacketDetails(ALCommon):
     """Belongs to PacketDetails"""
+    __slots__ = ('response_code', 'response_message')
+
     def __init__(self, response_dict):
         self.response_code = response_dict['response_code']
         self.response_message = response_dict['response_message']
@@ -0,0 +1,246 @@
+""" Streaming export of events as flat rows, one row per event, in NDJSON, CSV or (with pyarrow installed) Parquet.
+    Rows are written as the events arrive, e.g. straight from iter_events or Incident.iter_events, so nothing is built
+    up in memory beyond one Parquet row group. Payloads can be moved to a side file, in which case the rows only hold
+    the offset and length of the packet bytes in it.
+"""
+
+import csv
+import json
+import os
+import sys
+from collections import OrderedDict
+from pageparser import DETAIL_FIELDS
+from events import EventFailure
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+ROW_COLUMNS = (('incident_id', 'customer_id', 'event_id', 'event_url', 'event_time') +
+               tuple(field for field, group in DETAIL_FIELDS) +
+               ('sig_id', 'restful_call', 'request_protocol', 'host', 'resource', 'full_url', 'response_code',
+                'response_message'))
+PAYLOAD_COLUMNS = ('full_payload', 'decompressed')
+PAYLOAD_FILE_COLUMNS = ('payload_offset', 'payload_length')
+FORMATS = ('ndjson', 'csv', 'parquet')
+
+
+def event_row(event, incident_id=None, payloads=True):
+    """ Returns the flat OrderedDict of ROW_COLUMNS (and PAYLOAD_COLUMNS, with payloads) for an Event """
+    details = event.event_details
+    request_packet = event.event_payload.packet_details.request_packet
+    response_packet = event.event_payload.packet_details.response_packet
+    signature_details = event.signature_details if isinstance(event.signature_details, dict) else {}
+    row = OrderedDict([
+        ('incident_id', str(incident_id) if incident_id is not None else None),
+        ('customer_id', str(event.customer_id)),
+        ('event_id', str(event.event_id)),
+        ('event_url', event.event_url),
+        ('event_time', details.get('event_time'))
+        ])
+    for field, group in DETAIL_FIELDS:
+        row[field] = details.get(field)
+    row['sig_id'] = signature_details.get('sig_id')
+    row['restful_call'] = request_packet.restful_call
+    row['request_protocol'] = request_packet.protocol
+    row['host'] = request_packet.host
+    row['resource'] = request_packet.resource
+    row['full_url'] = request_packet.full_url
+    row['response_code'] = response_packet.response_code
+    row['response_message'] = response_packet.response_message
+    if payloads:
+        row['full_payload'] = event.event_payload.full_payload
+        row['decompressed'] = event.event_payload.decompressed
+    return row
+
+
+def file_size(f):
+    """ Size of the (flushed) output file f; None for stdout, which cannot be truncated """
+    if f is sys.stdout:
+        return None
+    f.flush()
+    return os.fstat(f.fileno()).st_size
+
+
+class NdjsonWriter(object):
+    """ One JSON object per line """
+
+    def __init__(self, f, columns):
+        self.f = f
+        self.columns = columns
+
+    def write(self, row):
+        self.f.write(json.dumps(row))
+        self.f.write('\n')
+
+    def flush(self):
+        self.f.flush()
+
+    def tell(self):
+        return file_size(self.f)
+
+    def truncate(self, position):
+        """ Drops everything written after position (from tell()) """
+        if position is not None:
+            self.f.flush()
+            self.f.truncate(position)
+
+    def close(self):
+        if self.f is sys.stdout:
+            self.f.flush()
+        else:
+            self.f.close()
+
+
+class CsvWriter(object):
+    """ CSV with a header row of the columns; None is written as an empty field """
+
+    def __init__(self, f, columns, header=True):
+        self.f = f
+        self.columns = columns
+        self.writer = csv.writer(f)
+        if header:
+            self.writer.writerow(columns)
+
+    def write(self, row):
+        self.writer.writerow(['' if row[c] is None else row[c] for c in self.columns])
+
+    def flush(self):
+        self.f.flush()
+
+    def tell(self):
+        return file_size(self.f)
+
+    def truncate(self, position):
+        if position is not None:
+            self.f.flush()
+            self.f.truncate(position)
+
+    def close(self):
+        if self.f is sys.stdout:
+            self.f.flush()
+        else:
+            self.f.close()
+
+
+class ParquetWriter(object):
+    """ Parquet file with one row group per flush; every column is a string apart from the payload offsets """
+
+    def __init__(self, path, columns):
+        if pyarrow is None:
+            raise ImportError('Parquet export requires pyarrow')
+        self.columns = columns
+        self.schema = pyarrow.schema([(c, pyarrow.int64() if c in PAYLOAD_FILE_COLUMNS else pyarrow.string())
+                                      for c in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def flush(self):
+        if not self.rows:
+            return
+        arrays = [pyarrow.array([row[c] for row in self.rows], type=self.schema.field_by_name(c).type)
+                  for c in self.columns]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+        self.rows = []
+
+    def tell(self):
+        return None  # the row groups already written cannot be dropped
+
+    def truncate(self, position):
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class EventExporter(object):
+    """ Writes events to path as flat rows in format (ndjson, csv or parquet; by default taken from the extension of
+        path). If payload_path is set, the payload bytes of every event are appended to it and the rows hold their
+        payload_offset and payload_length instead of the full_payload and decompressed text. Output is flushed every
+        batch_size rows (a Parquet row group). EventFailures are not written, only counted in failures. A path of '-'
+        writes to stdout, and with append an existing NDJSON or CSV file is continued (e.g. to resume a run).
+        discard() drops the rows written since the last flush(), e.g. those of a batch which was not checkpointed.
+    """
+
+    def __init__(self, path, format=None, payload_path=None, batch_size=1000, append=False):
+        if format is None:
+            format = 'ndjson' if path == '-' else path.rsplit('.', 1)[-1].lower()
+        self.format = format
+        if self.format not in FORMATS:
+            raise ValueError('Unknown export format {0}; use one of {1}'.format(self.format, ', '.join(FORMATS)))
+        self.batch_size = batch_size
+        self.columns = ROW_COLUMNS + (PAYLOAD_FILE_COLUMNS if payload_path is not None else PAYLOAD_COLUMNS)
+        self.rows = 0
+        self.failures = 0
+        self.payload_file = None
+        if payload_path is not None:
+            self.payload_file = open(payload_path, 'ab')
+            self.payload_offset = os.path.getsize(payload_path)  # appends to an existing side file
+        if self.format == 'parquet':
+            if append:
+                raise ValueError('Parquet files cannot be appended to')
+            self.writer = ParquetWriter(path, self.columns)
+        else:
+            appending = append and path != '-' and os.path.exists(path) and os.path.getsize(path) > 0
+            f = sys.stdout if path == '-' else open(path, 'ab' if append else 'wb')
+            if self.format == 'csv':
+                self.writer = CsvWriter(f, self.columns, header=not appending)
+            else:
+                self.writer = NdjsonWriter(f, self.columns)
+        self.flush()
+
+    def write_event(self, event, incident_id=None):
+        if isinstance(event, EventFailure):
+            self.failures += 1
+            return
+        row = event_row(event, incident_id, payloads=self.payload_file is None)
+        if self.payload_file is not None:
+            row['payload_offset'] = self.payload_offset
+            row['payload_length'] = len(event.event_payload.payload)
+            self.payload_file.write(event.event_payload.payload)
+            self.payload_offset += row['payload_length']
+        self.writer.write(row)
+        self.rows += 1
+        if self.rows % self.batch_size == 0:
+            self.__write_out()
+
+    def write_events(self, events, incident_id=None):
+        """ Writes every Event of an iterable, such as iter_events() or Incident.iter_events(), as it arrives """
+        for event in events:
+            self.write_event(event, incident_id)
+
+    def write_incident(self, incident):
+        self.write_events(incident.Events.values(), incident.incident_id)
+
+    def __write_out(self):
+        self.writer.flush()
+        if self.payload_file is not None:
+            self.payload_file.flush()
+
+    def flush(self):
+        """ Writes out the rows so far; they are kept by discard() """
+        self.__write_out()
+        self.__flushed = (self.rows, self.writer.tell(), self.payload_offset if self.payload_file is not None else None)
+
+    def discard(self):
+        """ Drops the rows written since the last flush() (rows already sent to stdout or in a written Parquet row
+            group cannot be dropped)
+        """
+        self.rows, position, payload_offset = self.__flushed
+        self.writer.truncate(position)
+        if self.payload_file is not None:
+            self.payload_file.flush()
+            self.payload_file.truncate(payload_offset)
+            self.payload_offset = payload_offset
+
+    def close(self):
+        self.writer.close()
+        if self.payload_file is not None:
+            self.payload_file.close()
@@ -0,0 +1,33 @@
+""" Decoding of the packet hex dump shown on the event page. The dump lines (see EventPageParser.parse_dump_lines) are
+    reduced to the true raw hex of the packets, converted to bytes with binascii and filtered down to printable ascii
+    with a translate table, so each step is a single linear pass in C rather than a per character Python loop.
+"""
+
+import binascii
+import re
+from string import printable
+
+
+# A hex word follows either the offset ("0x0010: ") or another hex word. Matching the whitespace before the lookbehinds
+# lets the regex engine skip every other position cheaply; the words found are the same as with the lookbehinds alone.
+HEX_CHUNK = re.compile(r'\s(?:(?<=0x[\da-fA_F]{4}:\s)|(?<=[\da-fA-F]{4}\s))\b([\da-fA-F]{2,4})\b')
+NON_PRINTABLE = ''.join(chr(c) for c in range(256) if chr(c) not in printable)  # includes every non ascii byte
+
+
+def raw_hex(dump_lines):
+    """ Returns the TRUE raw hex of the packets (offsets and the ascii column removed) from the dump lines """
+    return ''.join(HEX_CHUNK.findall(dump_lines))
+
+
+def printable_text(data):
+    """ Returns data (str or bytearray) with every byte that is not printable ascii removed """
+    return str(data.translate(None, NON_PRINTABLE))
+
+
+def decode_dump(dump_lines):
+    """ Returns (raw_hex, payload, printable_payload) for the dump lines, where payload is the packet bytes. Raises
+        TypeError if the hex is not a whole number of bytes.
+    """
+    hex_string = raw_hex(dump_lines)
+    payload = binascii.unhexlify(hex_string)
+    return hex_string, payload, printable_text(payload)
@@ -2,30 +2,236 @@
     additional summary and context information.
  """
 
-import threading
+from collections import OrderedDict
 from alertlogic import *
-from events import Event
+from events import Event, EventFailure, failure_category
+from pool import WorkerPool, CONSOLE_HOST
+from results import FetchResult, timed
+from deadline import as_deadline
+from transport import API_URL
+import instrument
 import pprint
 
 
+INCIDENT_API_URL = '{0}/api/incident/v3/incidents'.format(API_URL)
+INCIDENT_BATCH_SIZE = 50  # incident ids per incident API call; keeps the query string to a sane length
+
+
+def fetch_incident_details(session, api_key, incident_ids, customer_id=None, batch_size=INCIDENT_BATCH_SIZE,
+                           params=None, fetcher=None, deadline=None, errors=None):
+    """ Retrieves the details of many incidents with as few incident API calls as possible, by requesting the
+        incident ids batch_size at a time as the comma delimited list the incident v3 API takes for incident_id. If
+        incident_ids is None, a single query is made with only the params (extra incident API filters, e.g. a time
+        window for the customer). Returns an OrderedDict of {incident_id (str): incident details}; incidents the API
+        did not return (deleted, or of another customer) are missing from it. fetcher defaults to AlertLogic.fetcher.
+        A failed call (or an expired deadline, see deadline.py) raises, unless errors is a dict: the exception is then
+        stored in it for every id of the call and the other batches are still retrieved.
+    """
+    fetcher = fetcher if fetcher is not None else AlertLogic.fetcher
+    header = {'accept': 'application/json'}
+    query = {'customer_id': customer_id if customer_id is not None else 'all_children', 'escalated_only': 'false'}
+    query.update(params or {})
+
+    def __get(batch):
+        if batch is not None:
+            query['incident_id'] = ','.join(batch)
+        started = instrument.timer()
+        attempts = []
+        try:
+            r = fetcher.get(session, INCIDENT_API_URL, params=query, headers=header, auth=(api_key, ''),
+                            attempts=attempts, deadline=deadline)
+            if r.status_code != 200:
+                raise HttpStatusError('Incident API call failed. Status code: {0}. Reason: {1}. Attempts: {2}'.format(
+                    r.status_code, r.reason, len(attempts)), r.status_code)
+            for incident_details in r.json():
+                details[str(incident_details['incident_id'])] = incident_details
+        except Exception as e:
+            if errors is None or batch is None:
+                raise
+            for incident_id in batch:
+                errors[incident_id] = e
+        if started is not None:
+            transferred, retries = instrument.attempt_totals(attempts)
+            instrument.record('incident_details', started, bytes=transferred, retries=retries)
+
+    if incident_ids is None:
+        batches = [None]
+    else:
+        incident_ids = [str(i) for i in incident_ids]
+        batches = [incident_ids[i:i + batch_size] for i in range(0, len(incident_ids), batch_size)]
+    details = OrderedDict()
+    for batch in batches:
+        __get(batch)
+    if incident_ids is not None:  # keep the requested order
+        details = OrderedDict((i, details[i]) for i in incident_ids if i in details)
+    return details
+
+
+class IncidentFetchPlan(object):
+    """ Plans the retrieval of the events of many incidents. Evolved incidents share events (and an incident can list
+        the same event id twice), so the union of the event ids is fetched once and the resulting Event objects are
+        shared by every Incident which references them.
+    """
+
+    def __init__(self, incident_details, customer_id=None):
+        self.incident_details = incident_details    # {incident_id: incident API JSON}; see fetch_incident_details
+        self.customer_id = customer_id
+        self.event_keys = OrderedDict()             # (customer_id, event_id): [incident_ids]
+        for incident_id, details in incident_details.items():
+            for event_id in details['event_ids']:
+                self.event_keys.setdefault(self.event_key(details, event_id), []).append(incident_id)
+
+    def event_key(self, details, event_id):
+        customer_id = self.customer_id if self.customer_id is not None else details['customer_id']
+        return str(customer_id), event_id
+
+    def fetch_events(self, pool, fetch_event=None, deadline=None):
+        """ Fetches every unique event once with the pool. fetch_event(event_id, customer_id, deadline=None) defaults
+            to creating the Event. Returns three dicts keyed by (customer_id, event_id): the Events, the EventFailures
+            of the events which could not be retrieved (also those cut off by the deadline) and the seconds each took
+        """
+        return fetch_event_keys(pool, self.event_keys, fetch_event, deadline)
+
+    def events_for(self, incident_id, events):
+        """ Returns the {event_id: value} of one incident from any of the dicts returned by fetch_events """
+        details = self.incident_details[incident_id]
+        incident_events = OrderedDict()
+        for event_id in details['event_ids']:
+            key = self.event_key(details, event_id)
+            if key in events:
+                incident_events[event_id] = events[key]
+        return incident_events
+
+
+def fetch_event_keys(pool, keys, fetch_event=None, deadline=None):
+    """ Fetches the events of the (customer_id, event_id) keys with the pool; see IncidentFetchPlan.fetch_events """
+    fetch_event = fetch_event if fetch_event is not None else Event
+    events = {}
+    failures = {}
+    timings = {}
+    for key, outcome, error in pool.map(timed(lambda k: fetch_event(k[1], k[0], deadline=deadline)), keys,
+                                        host=CONSOLE_HOST, deadline=deadline):
+        if error is not None:
+            failures[key] = EventFailure(key[1], error)
+            timings[key] = failures[key].elapsed
+        else:
+            events[key], timings[key] = outcome
+    return events, failures, timings
+
+
+class IncidentFailure(ALCommon):
+    """Kept in the failures of an IncidentFetchResult for an incident which could not be retrieved"""
+    __slots__ = ('incident_id', 'error_type', 'message', 'category', 'elapsed')
+
+    def __init__(self, incident_id, error, elapsed=None):
+        self.incident_id = incident_id
+        self.error_type = type(error).__name__
+        self.message = str(error)
+        self.category = failure_category(error)
+        self.elapsed = elapsed
+
+    def __str__(self):
+        to_string = ('Incident ID: {0}\n'
+                     'Failed ({1}): {2}: {3}'.format(self.incident_id, self.category, self.error_type, self.message))
+        return to_string
+
+    def to_json(self):
+        to_json = {
+            'incident_id': self.incident_id,
+            'error_type': self.error_type,
+            'message': self.message,
+            'category': self.category,
+            'elapsed': self.elapsed
+            }
+        return to_json
+
+
+class IncidentFetchResult(FetchResult):
+    """ FetchResult of get_incidents. Its failures are the incidents which could not be retrieved, while the events
+        which failed are kept by their Incident (Incident.failures; see event_failures). retry_failed() retries both,
+        and fetches an event shared by several incidents only once. incidents holds the Incident objects also when the
+        results are their JSON. deadline (seconds or a Deadline) applies to the event retries.
+    """
+
+    def __init__(self, items=(), ids=None, fetch=None, pool=None, fetch_event=None, as_json=False, deadline=None):
+        FetchResult.__init__(self, items, ids, fetch)
+        self.incidents = OrderedDict()
+        self.pool = pool
+        self.fetch_event = fetch_event
+        self.as_json = as_json
+        self.deadline = deadline
+
+    def add_incident(self, incident_id, incident):
+        self.incidents[incident_id] = incident
+        self.add(incident_id, incident.to_json() if self.as_json else incident)
+
+    def event_failures(self):
+        """ Returns {(customer_id, event_id): EventFailure} of the failed events of all incidents """
+        return OrderedDict(((incident.customer_id, event_id), failure) for incident in self.incidents.values()
+                           for event_id, failure in incident.failures.items())
+
+    def merge(self, other):
+        FetchResult.merge(self, other)
+        self.incidents.update(getattr(other, 'incidents', {}))
+        return self
+
+    def retry_failed(self, category=None):
+        FetchResult.retry_failed(self, category)
+        keys = OrderedDict()  # (customer_id, event_id): [Incidents]
+        for incident in self.incidents.values():
+            for event_id in incident.failed_event_ids(category):
+                keys.setdefault((incident.customer_id, event_id), []).append(incident)
+        if not keys:
+            return self
+        events, failures, timings = fetch_event_keys(self.pool or WorkerPool(), keys, self.fetch_event,
+                                                     as_deadline(self.deadline))
+        for key, incidents in keys.items():
+            for incident in incidents:
+                if key in failures:
+                    incident.failures[key[1]] = failures[key]
+                else:
+                    incident.add_event(events[key], timings[key])
+        for incident_id, incident in self.incidents.items():
+            incident.sort_events()
+            if self.as_json and incident_id in self:
+                self[incident_id] = incident.to_json()
+        return self
+
+
 class Incident(AlertLogic):
     """ If credentials are not instantiated, then they must be set prior to implementation with set_api_key and
         set_credentials. This is the primary object of this API. Incident is comprised of all the details which
-        encompass an Incident, to include Event objects.
+        encompass an Incident, to include Event objects. deadline (seconds or a Deadline, see deadline.py) bounds the
+        retrieval of the incident and its events (or, with lazy, of iter_events); the events which did not finish in
+        time are in failures.
     """
 
-    def __init__(self, incident_id, customer_id=None, api_key=None, username=None, password=None):
+    def __init__(self, incident_id, customer_id=None, api_key=None, username=None, password=None, pool=None,
+                 lazy=False, incident_details=None, events=None, client=None, deadline=None):
+        self.client = client                    # Client (see client.py); None uses the class level credentials
+        self.deadline = as_deadline(deadline)   # Deadline of the retrieval, or None
         self.incident_id = str(incident_id)
         self.customer_id = str(customer_id) if customer_id is not None else None     # all_children includes all accounts that the caller can access
         self.incident_details = ''              # JSON; get_incident_details()
         self.event_ids = ''                     # list of str; retrieved and set in get_incident_details
-        if self.api_key is None and api_key is not None:
+        self.pool = pool if pool is not None else WorkerPool()  # bounded pool used by get_event_objects
+        self.Events = OrderedDict()             # set by get_event_objects() or filled by iter_events()
+        self.failures = OrderedDict()           # event_id: EventFailure of the events not retrieved; see retry_failed
+        self.timings = OrderedDict()            # event_id: seconds taken by the event
+        self.events_summary = ''                # object --> EventsPacketSummary; set by get_event_summary()
+        if client is None and self.api_key is None and api_key is not None:
             AlertLogic.set_api_key(self, api_key)
-        if self.api_key is not None:
+        if incident_details is not None:
+            self.set_incident_details(incident_details)  # already retrieved, e.g. by fetch_incident_details
+        elif self.get_api_key() is not None:
                 self.get_incident_details()      # sets incident_details and event_ids
-        if self.username is None or self.password is None and (username is not None and password is not None):
+        if client is None and (self.username is None or self.password is None and (username is not None and
+                                                                                     password is not None)):
             AlertLogic.set_credentials(self, username, password)
-        if self.username is not None and self.password is not None:
+        if events is not None:  # already retrieved, e.g. shared through an IncidentFetchPlan
+            self.Events = OrderedDict((i, events[i]) for i in self.event_ids if i in events)
+            self.events_summary = self.get_event_summary()
+        elif self.has_credentials() and not lazy:
             self.Events = self.get_event_objects()  # list; Event class objects; set by get_events() #TODO: capitalize?
             self.events_summary = self.get_event_summary()  # dict; 'breakdown': {}, 'summary': object()  #TODO: capitalize?
 
@@ -43,6 +249,17 @@ class Incident(AlertLogic):
                         event_string))
         return to_string
 
+    def __getstate__(self):
+        """ The pool, client and deadline are runtime handles (holding locks and sessions) and are not pickled """
+        state = self.__dict__.copy()
+        state.update(pool=None, client=None, deadline=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.pool is None:
+            self.pool = WorkerPool()
+
     def to_json(self):
         to_json = {
             'incident_id': self.incident_id,
@@ -145,64 +362,120 @@ class Incident(AlertLogic):
             }
         """
 
-        local_cust_id = self.customer_id if self.customer_id is not None else 'all_children'
-        if self.api_key is None:
+        api_key = self.get_api_key()
+        if api_key is None:
             raise CredentialsNotSet('Missing api key. If not instantiated, set with set_api_key()')
-        header = {'accept': 'application/json'}
-        url = 'https://api.alertlogic.net/api/incident/v3/incidents?incident_id={0}&customer_id={1}&escalated_only=false'.format(
-            self.incident_id, local_cust_id)
-        r = requests.get(url, headers=header, auth=(self.api_key, ''))
-        if r.status_code != 200:
-            raise NotAuthenticatedError('API Failed to authenticate')
-        try:
-            self.incident_details = r.json()[0]
-            self.event_ids = list(r.json()[0]['event_ids'])
-            if self.customer_id is None:
-                self.customer_id = self.incident_details['customer_id']
-            return
-        except requests.RequestException:
-            raise requests.RequestException('An error occurred trying to parse the incident details from "requests"')
-        except IndexError as e:
+        details = fetch_incident_details(self.get_session(), api_key, [self.incident_id], self.customer_id,
+                                         fetcher=self.get_fetcher(), deadline=self.deadline)
+        if self.incident_id not in details:
             raise IncidentNotRetrievedError('An error occurred parsing the results of the incident API call for this '
                                             'incident. Check the actual incident page for details')
+        self.set_incident_details(details[self.incident_id])
+
+    def set_incident_details(self, incident_details):
+        """Sets incident_details, event_ids and (if not set) customer_id from the incident API JSON of this incident"""
+        self.incident_details = incident_details
+        self.event_ids = list(incident_details['event_ids'])
+        if self.customer_id is None:
+            self.customer_id = self.incident_details['customer_id']
 
     def get_event_object(self, event_id):
-        if self.username is None or self.password is None:
+        if not self.has_credentials():
             raise CredentialsNotSet('Missing username or password. If not instantiated, set with set_credentials()')
         if self.customer_id is None:
             raise EventNotRetrievedError('Customer ID is not set')
-        return Event(event_id, self.customer_id)
+        return Event(event_id, self.customer_id, client=self.client, deadline=self.deadline)
 
     def get_event_objects(self):
-        event_object_dict = {}
-        threads = []
-        errors = []  # TODO: How to handle errors collected? Use suppress flag? Auto-inclusion in the dict?
-
-        def __multi_get_events(thread_event_id):  # for threading
-            try:
-                event_object_dict[thread_event_id] = self.get_event_object(thread_event_id)
-            except Exception as e:
-                errors.append(e.message)
-                pass
-
-        for i in self.event_ids:
-            t = threading.Thread(target=__multi_get_events, args=(i,))
-            threads.append(t)
-            t.start()
-        for _thread in threads:
-            _thread.join()
+        """ Retrieves every event of the incident with the pool and returns {event_id: Event}. The events which could
+            not be retrieved are kept in self.failures (see retry_failed) and the seconds of each in self.timings
+        """
+        event_object_dict = OrderedDict()
+        unique_event_ids = OrderedDict.fromkeys(self.event_ids)  # an incident can list the same event twice
+        for event_id, outcome, error in self.pool.map(timed(self.get_event_object), unique_event_ids,
+                                                      host=CONSOLE_HOST, deadline=self.deadline):
+            if error is not None:
+                self.failures[event_id] = EventFailure(event_id, error)
+                self.timings[event_id] = self.failures[event_id].elapsed
+                continue
+            event_object_dict[event_id], self.timings[event_id] = outcome
         return event_object_dict
 
+    def add_event(self, event, elapsed=None):
+        """ Adds a retrieved Event to self.Events and self.events_summary, and clears its failure """
+        if self.events_summary == '':
+            self.events_summary = EventsPacketSummary()
+        self.Events[event.event_id] = event
+        self.events_summary.add(event)
+        self.failures.pop(event.event_id, None)
+        if elapsed is not None:
+            self.timings[event.event_id] = elapsed
+
+    def sort_events(self):
+        """ Puts self.Events back in the order of event_ids, e.g. after events were added by a retry """
+        self.Events = OrderedDict((i, self.Events[i]) for i in OrderedDict.fromkeys(self.event_ids)
+                                  if i in self.Events)
+
+    def failed_event_ids(self, category=None):
+        """ The IDs of the events which could not be retrieved, or of those which failed with the category """
+        return [i for i, failure in self.failures.items() if category is None or failure.category == category]
+
+    def retry_failed(self, category=None, deadline=None):
+        """ Retrieves only the failed events (of the category, if given) again, within the new deadline if given;
+            returns the list of Events and EventFailures of the retry
+        """
+        self.deadline = as_deadline(deadline)
+        retried = list(self.iter_events(self.failed_event_ids(category)))
+        self.sort_events()
+        return retried
+
+    def iter_events(self, event_ids=None):
+        """ Generator which yields each Event (or EventFailure) as soon as it is retrieved, in completion order. Use
+            with lazy=True to process events while later pages are still downloading. Retrieved events are also added
+            to self.Events and to self.events_summary, which stays current as the events arrive, and failed ones to
+            self.failures. event_ids defaults to all of the incident's events.
+        """
+        if self.events_summary == '':
+            self.events_summary = EventsPacketSummary()
+        unique_event_ids = OrderedDict.fromkeys(self.event_ids if event_ids is None else event_ids)
+        for event_id, outcome, error in self.pool.imap_unordered(timed(self.get_event_object), unique_event_ids,
+                                                                 host=CONSOLE_HOST, deadline=self.deadline):
+            if error is not None:
+                failure = self.failures[event_id] = EventFailure(event_id, error)
+                self.timings[event_id] = failure.elapsed
+                yield failure
+                continue
+            event, elapsed = outcome
+            self.add_event(event, elapsed)
+            yield event
+
+    def refresh(self, incident_details=None, deadline=None):
+        """ Updates the incident in place for watch mode: the incident details are retrieved again (or taken from
+            incident_details) and only the events which are not in self.Events yet are retrieved and added to
+            self.Events and self.events_summary. So the cost of a refresh grows with the new events rather than with
+            all of the events. Returns the list of new Events and EventFailures (failed events are tried again by the
+            next refresh). deadline replaces the deadline of the incident for this refresh.
+        """
+        self.deadline = as_deadline(deadline)
+        if incident_details is None:
+            self.get_incident_details()
+        else:
+            self.set_incident_details(incident_details)
+        new_event_ids = [i for i in OrderedDict.fromkeys(self.event_ids) if i not in self.Events]
+        return list(self.iter_events(new_event_ids))
+
     def get_event_summary(self):
         return EventsPacketSummary(self.Events)
 
 
 class EventsPacketSummary(ALCommon):
-    """Belongs to Incidents.events_summary"""
-    def __init__(self, events_list):
-        self.breakdown = ''                 # JSON breakdown: signature->host->response_code->[event_ids]
-        self.summary = ''                   # object --> PacketSummarySummary
-        self.get_events_info(events_list)   # breakdown to JSON amd summary to a list of EventsPacketSummary objects
+    """Belongs to Incidents.events_summary. Can be built from a dict of events at once, or kept current with add() as
+    events arrive; summaries of several incidents (or workers) can be combined with merge()"""
+    def __init__(self, events_list=None):
+        self.breakdown = {}                 # JSON breakdown: signature->host->response_code->[event_ids]
+        self.summary = EventsSummarySummary({}, {}, {})  # object --> PacketSummarySummary
+        if events_list is not None:
+            self.get_events_info(events_list)   # breakdown to JSON amd summary to a list of EventsPacketSummary objects
 
     def __str__(self):
         pp = pprint.PrettyPrinter(indent=4)
@@ -218,8 +491,7 @@ class EventsPacketSummary(ALCommon):
         return to_json
 
     def get_events_info(self, events_list):
-        """Iterates through the event objects and sets the global breakdown to JSON and the global summary to an
-            EventPacketSummary object
+        """Iterates through the event objects and adds each to the global breakdown and the global summary
 
             ###########################################################
             # structure
@@ -243,51 +515,43 @@ class EventsPacketSummary(ALCommon):
             #      }
             ###########################################################
         """
-        packet_breakdown = {}
-        unique_signatures = {}      # sig: [sig_applicable_events]
-        unique_hosts = {}           # host: [hosts_applicable_events]
-        response_code_tally = {}    # code: [code_applicable_events]
-        # TODO!! This likely needs work as the summary was overriding itself and only returning final host with this alg
+        started = instrument.timer()
         for individual_event in events_list.values():  # this is a list of objects
-            # do magic to pull out event summary
-                try:
-                    # *details*
-                    signature = individual_event.event_details['signature_name']
-                    host = individual_event.event_payload.packet_details.request_packet.host
-                    response = individual_event.event_payload.packet_details.response_packet.response_code
-                    individual_event_id = individual_event.event_id
-
-                    if signature not in packet_breakdown.keys():
-                        packet_breakdown[signature] = {host: {response: [individual_event_id]}}
-                    elif host not in packet_breakdown[signature].keys():
-                        packet_breakdown[signature][host] = {response: [individual_event_id]}
-                    elif response not in packet_breakdown[signature][host].keys():
-                        packet_breakdown[signature][host][response] = [individual_event_id]
-                    else:
-                        packet_breakdown[signature][host][response].append(individual_event_id)
-                except KeyError:
-                    continue  # packet failed to retrieve from get_event
-
-                #######################################################
-                # *summary*
-                # signatures
-                if signature not in unique_signatures.keys():
-                    unique_signatures[signature] = [individual_event_id]
-                else:
-                    unique_signatures[signature].append(individual_event_id)
-                # hosts
-                if host not in unique_hosts.keys():
-                    unique_hosts[host] = [individual_event_id]
-                else:
-                    unique_hosts[host].append(individual_event_id)
-                # response codes
-                if response not in response_code_tally.keys():
-                    response_code_tally[response] = [individual_event_id]
-                else:
-                    response_code_tally[response].append(individual_event_id)
-        #####################################################################
-        self.breakdown = packet_breakdown
-        self.summary = EventsSummarySummary(unique_signatures, unique_hosts, response_code_tally)
+            self.add(individual_event)
+        instrument.record('summary', started)
+
+    def add(self, individual_event):
+        """Adds a single Event to the breakdown and summary in place"""
+        try:
+            # *details*
+            signature = individual_event.event_details['signature_name']
+            host = individual_event.event_payload.packet_details.request_packet.host
+            response = individual_event.event_payload.packet_details.response_packet.response_code
+            individual_event_id = individual_event.event_id
+        except KeyError:
+            return  # packet failed to retrieve from get_event
+        self.breakdown.setdefault(signature, {}).setdefault(host, {}).setdefault(response, []).append(
+            individual_event_id)
+        #######################################################
+        # *summary*
+        self.summary.unique_signatures.setdefault(signature, []).append(individual_event_id)
+        self.summary.unique_hosts.setdefault(host, []).append(individual_event_id)
+        self.summary.response_code_tally.setdefault(response, []).append(individual_event_id)
+
+    def merge(self, other):
+        """Adds the events of another EventsPacketSummary to this one; returns self"""
+        for signature, hosts in other.breakdown.items():
+            local_hosts = self.breakdown.setdefault(signature, {})
+            for host, responses in hosts.items():
+                local_responses = local_hosts.setdefault(host, {})
+                for response, event_ids in responses.items():
+                    local_responses.setdefault(response, []).extend(event_ids)
+        for local, merged in ((self.summary.unique_signatures, other.summary.unique_signatures),
+                              (self.summary.unique_hosts, other.summary.unique_hosts),
+                              (self.summary.response_code_tally, other.summary.response_code_tally)):
+            for key, event_ids in merged.items():
+                local.setdefault(key, []).extend(event_ids)
+        return self
 
 
 class EventsSummarySummary(ALCommon):
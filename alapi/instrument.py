@@ -0,0 +1,138 @@
+""" Timing of the stages of event and incident retrieval. Every stage (log-in, page download, parsing, signature lookup,
+    decompression, incident details and summary build) reports its duration, with the bytes transferred and retries
+    where it has any, to the hooks added with add_hook(). A hook is any callable taking (stage, seconds, bytes, retries);
+    MetricsCollector aggregates them in process and StatsdHook and PrometheusHook export them. With no hooks added the
+    instrumented code only checks an empty list, so there is no measurable overhead.
+"""
+
+import socket
+import threading
+import time
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+
+STAGES = ('login', 'download', 'parse', 'signature', 'decompress', 'incident_details', 'summary')
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)  # seconds
+
+hooks = []
+
+
+def add_hook(hook):
+    if hook not in hooks:
+        hooks.append(hook)
+
+
+def remove_hook(hook):
+    if hook in hooks:
+        hooks.remove(hook)
+
+
+def timer():
+    """ Returns the start time for record(), or None when no hooks are set so that record() does nothing """
+    return time.time() if hooks else None
+
+
+def record(stage, started, bytes=0, retries=0):
+    """ Reports the time since started (from timer()) for the stage to every hook """
+    if started is None:
+        return
+    report(stage, time.time() - started, bytes, retries)
+
+
+def report(stage, seconds, bytes=0, retries=0):
+    """ Passes a measurement taken elsewhere (e.g. in a worker process, see pipeline.py) to every hook """
+    for hook in list(hooks):
+        hook(stage, seconds, bytes, retries)
+
+
+def attempt_totals(attempts):
+    """ Returns (bytes, retries) of the attempt records of a retry.Fetcher request """
+    return sum(attempt.get('bytes', 0) for attempt in attempts), max(len(attempts) - 1, 0)
+
+
+class MetricsCollector(object):
+    """ Hook keeping per stage counts, total and maximum seconds, bytes, retries and a histogram of the durations """
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.__stages = {}
+        self.__lock = threading.Lock()
+
+    def __call__(self, stage, seconds, bytes=0, retries=0):
+        with self.__lock:
+            metrics = self.__stages.get(stage)
+            if metrics is None:
+                metrics = self.__stages[stage] = {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'bytes': 0,
+                                                  'retries': 0, 'histogram': [0] * (len(self.buckets) + 1)}
+            metrics['count'] += 1
+            metrics['seconds'] += seconds
+            metrics['max_seconds'] = max(metrics['max_seconds'], seconds)
+            metrics['bytes'] += bytes
+            metrics['retries'] += retries
+            bucket = 0
+            while bucket < len(self.buckets) and seconds > self.buckets[bucket]:
+                bucket += 1
+            metrics['histogram'][bucket] += 1
+
+    def snapshot(self):
+        """ Returns {stage: metrics}; histogram[i] counts durations up to buckets[i], the last one the rest """
+        with self.__lock:
+            return dict((stage, dict(metrics, histogram=list(metrics['histogram'])))
+                        for stage, metrics in self.__stages.items())
+
+    def __str__(self):
+        lines = ['{0:>18} {1:>8} {2:>10} {3:>10} {4:>12} {5:>8}'.format(
+            'stage', 'count', 'total (s)', 'mean (ms)', 'bytes', 'retries')]
+        for stage, metrics in sorted(self.snapshot().items()):
+            lines.append('{0:>18} {1:>8} {2:>10.2f} {3:>10.2f} {4:>12} {5:>8}'.format(
+                stage, metrics['count'], metrics['seconds'], metrics['seconds'] / metrics['count'] * 1000,
+                metrics['bytes'], metrics['retries']))
+        return '\n'.join(lines)
+
+
+class StatsdHook(object):
+    """ Sends every measurement to a StatsD server over UDP as <prefix>.<stage>.time (ms), .bytes and .retries """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='alapi'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, stage, seconds, bytes=0, retries=0):
+        metrics = ['{0}.{1}.time:{2:.3f}|ms'.format(self.prefix, stage, seconds * 1000)]
+        if bytes:
+            metrics.append('{0}.{1}.bytes:{2}|c'.format(self.prefix, stage, bytes))
+        if retries:
+            metrics.append('{0}.{1}.retries:{2}|c'.format(self.prefix, stage, retries))
+        try:
+            self.socket.sendto('\n'.join(metrics), self.address)
+        except socket.error:
+            pass  # metrics are best effort
+
+
+class PrometheusHook(object):
+    """ Records the stages in prometheus_client metrics (alapi_stage_seconds, alapi_stage_bytes_total and
+        alapi_stage_retries_total, labelled by stage) in the given or the default registry
+    """
+
+    def __init__(self, registry=None, buckets=HISTOGRAM_BUCKETS):
+        if prometheus_client is None:
+            raise ImportError('PrometheusHook requires prometheus_client')
+        registry = registry if registry is not None else prometheus_client.REGISTRY
+        self.seconds = prometheus_client.Histogram('alapi_stage_seconds', 'Duration of alapi stages', ['stage'],
+                                                   buckets=buckets, registry=registry)
+        self.bytes = prometheus_client.Counter('alapi_stage_bytes_total', 'Bytes transferred by alapi stages',
+                                               ['stage'], registry=registry)
+        self.retries = prometheus_client.Counter('alapi_stage_retries_total', 'Retried requests of alapi stages',
+                                                 ['stage'], registry=registry)
+
+    def __call__(self, stage, seconds, bytes=0, retries=0):
+        self.seconds.labels(stage).observe(seconds)
+        if bytes:
+            self.bytes.labels(stage).inc(bytes)
+        if retries:
+            self.retries.labels(stage).inc(retries)
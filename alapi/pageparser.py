@@ -0,0 +1,84 @@
+""" Parser for the threat manager event page (event.php). All of the patterns are compiled once at import, the page
+    fields are found with a single scan of one combined pattern, and only the packet dump section is then walked line
+    by line for the hex dump. The parser does no network access, so it can be run (and benchmarked) on saved pages.
+"""
+
+import re
+
+
+# The start and end markers are the most susceptible to breaking due to changes by Alert Logic!
+DUMP_START_MARKER = '<td>Signature: '
+DUMP_START_OFFSET = 18
+DUMP_END_MARKER = '<table id="cache_table" style="display: none;">'
+
+DETAIL_FIELDS = (
+    ('source_addr', 'source_address'),
+    ('dest_addr', 'dest_address'),
+    ('source_port', 'source_port'),
+    ('dest_port', 'dest_port'),
+    ('signature_name', 'signature_name'),
+    ('sensor', 'sensor'),
+    ('protocol', 'protocol'),
+    ('classification', 'classification'),
+    ('severity', 'severity')
+    )
+
+_DETAILS = ''.join("\\s*var {0} = '(?P<{1}>.+)';\\s*\\n".format(var, group) for var, group in DETAIL_FIELDS)
+_SIG_ID = '<strong><a\\shref="/signature.php\\?[\\w=&]*sid=(?P<sig_id>\\d+)'
+_SIG_RAW = '<td>Signature\\sContent:</td>[\\s\\n]+<td>(?P<sig_rule>[\\s\\S]*?)</td>\\s*'
+_EVENT_TIME = '<td>Engine\\sTime:</td>\\s+<td><span\\sclass="bold">(?P<event_time>.*?)</span></td>'
+
+PAGE_FIELDS = re.compile('(?P<details>{0})|(?P<sig_link>{1})|(?P<sig_raw>{2})|(?P<engine_time>{3})'.format(
+    _DETAILS, _SIG_ID, _SIG_RAW, _EVENT_TIME))
+HEX_LINE = re.compile(r'0x[\da-f]{4}:[\s\da-f]+\W')
+
+
+class EventPageParser(object):
+    """ Extracts every field used by Event from the raw event page. parse() returns a dict:
+
+        {
+            'details': {<DETAIL_FIELDS>: str or 'none_parsed', 'event_time': str (only when found)},
+            'sig_id': str or None,
+            'sig_rule': str or None,     # raw (still html escaped) rule when included in the page
+            'raw_hex': str               # the hex dump lines of the packets, one per line
+        }
+    """
+
+    def parse(self, page):
+        details = dict((field, 'none_parsed') for field, group in DETAIL_FIELDS)
+        parsed = {
+            'details': details,
+            'sig_id': None,
+            'sig_rule': None,
+            'raw_hex': self.parse_dump_lines(page)
+            }
+        remaining = set(['details', 'sig_link', 'sig_raw', 'engine_time'])
+        for match in PAGE_FIELDS.finditer(page):
+            kind = match.lastgroup
+            if kind not in remaining:
+                continue  # only the first match of each kind is used
+            remaining.discard(kind)
+            if kind == 'details':
+                for field, group in DETAIL_FIELDS:
+                    details[field] = match.group(group)
+            elif kind == 'sig_link':
+                parsed['sig_id'] = match.group('sig_id')
+            elif kind == 'sig_raw':
+                parsed['sig_rule'] = match.group('sig_rule')
+            else:
+                details['event_time'] = match.group('event_time')
+            if not remaining:
+                break
+        return parsed
+
+    def parse_dump_lines(self, page):
+        """ Returns the lines of the packet dump section which contain hex, stripped and newline terminated """
+        start_parse = page.find(DUMP_START_MARKER) - DUMP_START_OFFSET
+        end_parse = page.find(DUMP_END_MARKER)
+        dump_lines = []
+        for line in page[start_parse:end_parse].splitlines():
+            line = line.strip()
+            if HEX_LINE.search(line) is not None:
+                dump_lines.append(line)
+                dump_lines.append('\n')
+        return ''.join(dump_lines)
@@ -0,0 +1,114 @@
+""" Pipelined event retrieval for multi-core hosts. Parsing an event page (regexes, hex decoding, printable filtering and
+    decompression) is CPU bound and holds the GIL, so with plain threads it is limited to one core however many pages
+    are downloaded at once. Here the WorkerPool threads only download the raw event pages, and a ParsePool of worker
+    processes parses them in batches of chunksize pages while further pages are still downloading. The signature
+    lookup and the event cache remain in this process, and the parse and decompress timings measured in the worker
+    processes are reported to the hooks of this one (see instrument.py).
+"""
+
+import multiprocessing
+from collections import deque
+from events import Event, EventFailure, parse_event_page
+from errors import EventParseError
+from pool import WorkerPool, CONSOLE_HOST
+import instrument
+
+
+DEFAULT_CHUNK_SIZE = 8
+
+
+def parse_pages(pages, timed=False):
+    """ Runs in the worker processes: returns [(parsed, error, measurements)] for the pages (see
+        events.parse_event_page). With timed, measurements holds the (stage, seconds, bytes, retries) of the page for
+        instrument.report in the parent process, as hooks added there do not reach these processes
+    """
+    measurements = []
+    instrument.hooks[:] = [lambda *measurement: measurements.append(measurement)] if timed else []
+    results = []
+    for page in pages:
+        try:
+            results.append((parse_event_page(page, decompress=True), None, measurements))
+        except Exception as e:
+            results.append((None, EventParseError('Failed to parse the event page. {0}: {1}'.format(
+                type(e).__name__, e)), measurements))
+        measurements = []
+    return results
+
+
+class ParsePool(object):
+    """ Pool of processes (default: one per cpu) which parse event pages chunksize pages at a time. At most
+        max_pending chunks are queued before parse_events waits for the oldest, which bounds the pages held in memory.
+        The processes are started on creation, so create the pool before starting other threads; close() stops them.
+    """
+
+    def __init__(self, processes=None, chunksize=DEFAULT_CHUNK_SIZE, max_pending=None):
+        self.processes = processes if processes is not None else multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.max_pending = max_pending if max_pending is not None else self.processes * 2
+        self.__pool = multiprocessing.Pool(self.processes)
+
+    def submit(self, pages):
+        """ Starts parsing the pages; returns an AsyncResult of parse_pages """
+        return self.__pool.apply_async(parse_pages, (pages, bool(instrument.hooks)))
+
+    def iter_events(self, event_id_list, customer_id, client=None, pool=None, deadline=None):
+        """ Yields each Event (or EventFailure) of the customer once it has been downloaded by the WorkerPool and
+            parsed by this pool, in completion order. Cached events are yielded as soon as they are read. The
+            deadline (see deadline.py) applies to the downloads as in WorkerPool.imap_unordered.
+        """
+        pool = pool if pool is not None else WorkerPool()
+
+        def __download(event_id):  # for the worker pool
+            event = Event(event_id, customer_id, client=client, lazy=True, deadline=deadline)
+            if event.load_from_cache():
+                return event, None
+            return event, event.fetch_page()
+
+        def __event_pages():
+            for event_id, result, error in pool.imap_unordered(__download, event_id_list, host=CONSOLE_HOST,
+                                                               deadline=deadline):
+                yield (EventFailure(event_id, error), None) if error is not None else result
+
+        return self.parse_events(__event_pages())
+
+    def parse_events(self, event_pages, fetch_signatures=True):
+        """ Takes (Event, page) pairs, parses the pages in this pool and yields each Event once it is set from its
+            page (see Event.load_parsed), or an EventFailure. A pair without a page is yielded as it is.
+        """
+        pending = deque()  # ([Event], AsyncResult)
+        batch = []
+        for event, page in event_pages:
+            if page is None:
+                yield event
+                continue
+            batch.append((event, page))
+            if len(batch) >= self.chunksize:
+                pending.append(self.__submit_batch(batch))
+                batch = []
+            while pending and (pending[0][1].ready() or len(pending) > self.max_pending):
+                for event in self.__finish(fetch_signatures, *pending.popleft()):
+                    yield event
+        if batch:
+            pending.append(self.__submit_batch(batch))
+        while pending:
+            for event in self.__finish(fetch_signatures, *pending.popleft()):
+                yield event
+
+    def __submit_batch(self, batch):
+        return [event for event, page in batch], self.submit([page for event, page in batch])
+
+    @staticmethod
+    def __finish(fetch_signatures, events, async_result):
+        for event, (parsed, error, measurements) in zip(events, async_result.get()):
+            for measurement in measurements:
+                instrument.report(*measurement)
+            if error is None:
+                try:
+                    event.load_parsed(parsed, fetch_signature=fetch_signatures)
+                except Exception as e:
+                    error = e
+            yield event if error is None else EventFailure(event.event_id, error)
+
+    def close(self):
+        self.__pool.close()
+        self.__pool.join()
@@ -0,0 +1,193 @@
+""" Bounded worker pool used for all of the fan-out fetching (events and incidents). Rather than starting one thread
+    per ID, a fixed number of workers pull from a bounded queue, and each host can optionally be capped so that the
+    console is never hit with more concurrent page pulls than it (or the connection pool) can handle.
+"""
+
+import threading
+import Queue
+
+
+CONSOLE_HOST = 'console.clouddefender.alertlogic.com'
+API_HOST = 'api.alertlogic.net'
+
+DEFAULT_MAX_WORKERS = 10
+DEFAULT_HOST_LIMITS = {
+    CONSOLE_HOST: 10,
+    API_HOST: 4
+    }
+
+_STOP = object()  # sentinel telling a worker to exit
+POLL_INTERVAL = 0.1  # seconds between the checks of a deadline while waiting for results
+
+
+class WorkerPool(object):
+    """ Runs a function over a list of items with at most max_workers threads. The work queue holds at most max_queue
+        pending items and host_limits ({host: max_concurrent}) caps concurrency per host across every map call made
+        on the same pool, so nested fan-outs (incidents -> events) sharing a pool still respect the caps.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_queue=None, host_limits=None):
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self.max_workers = max_workers
+        self.max_queue = max_queue if max_queue is not None else max_workers * 2
+        self.host_limits = dict(DEFAULT_HOST_LIMITS if host_limits is None else host_limits)
+        self.__host_semaphores = {}
+        self.__lock = threading.Lock()
+
+    def host_semaphore(self, host):
+        """ Returns the shared semaphore for the host, or None if the host is not capped """
+        if host is None or host not in self.host_limits:
+            return None
+        with self.__lock:
+            if host not in self.__host_semaphores:
+                self.__host_semaphores[host] = threading.BoundedSemaphore(self.host_limits[host])
+            return self.__host_semaphores[host]
+
+    def map(self, func, items, host=None, deadline=None):
+        """ Calls func on every item and returns a list of (item, result, error) tuples in input order. error is the
+            exception raised by func (result is then None), otherwise None. With a deadline (see deadline.Deadline),
+            the items which did not finish before it expired have its error (DeadlineExceededError or CancelledError).
+        """
+        items = list(items)
+        results = {}
+        for (index, item), result, error in self.imap_unordered(lambda task: func(task[1]), list(enumerate(items)),
+                                                                host, deadline):
+            results[index] = (item, result, error)
+        return [results[i] for i in range(len(items))]
+
+    def imap_unordered(self, func, items, host=None, deadline=None):
+        """ Generator version of map which yields each (item, result, error) tuple as soon as it completes. Finished
+            results are held in a queue of at most max_queue entries; once it is full the workers wait for the
+            consumer, so a slow consumer throttles the fetching rather than letting results pile up in memory.
+            Closing the generator early stops any work which has not been started yet. With a deadline, the work
+            stops as soon as it expires or is cancelled: the results which already finished are yielded, then every
+            other item (started, queued or not yet taken from items) with the deadline's error. Workers still in a
+            request finish it in the background (bounded by the request timeout) and their results are dropped. At most one worker per item is started when items has a length.
+        """
+        work = Queue.Queue(maxsize=self.max_queue)
+        done = Queue.Queue(maxsize=self.max_queue)
+        stop = threading.Event()
+        semaphore = self.host_semaphore(host)
+        pending = {}  # index: item; the items fed and not finished yet, only kept with a deadline
+        pending_lock = threading.Lock()
+        indexed_items = enumerate(items)
+        take_lock = threading.Lock()
+
+        def __worker():
+            while True:
+                task = work.get()
+                if task is _STOP:
+                    done.put(_STOP)
+                    return
+                if stop.is_set():
+                    continue  # drain remaining work without running it
+                index, item = task
+                try:
+                    if semaphore is not None:
+                        with semaphore:
+                            result = func(item)
+                    else:
+                        result = func(item)
+                    done.put((index, item, result, None))
+                except Exception as e:
+                    done.put((index, item, None, e))
+
+        workers = self.max_workers
+        if hasattr(items, '__len__'):
+            workers = max(min(workers, len(items)), 1)
+        threads = []
+        for i in range(workers):
+            t = threading.Thread(target=__worker)
+            t.daemon = True
+            threads.append(t)
+            t.start()
+
+        def __feeder():
+            try:
+                while True:
+                    with take_lock:  # once stop is set, only the consumer takes from items
+                        if stop.is_set():
+                            break
+                        try:
+                            index, item = next(indexed_items)
+                        except StopIteration:
+                            break
+                        if deadline is not None:
+                            with pending_lock:
+                                pending[index] = item
+                    if deadline is None:
+                        work.put((index, item))  # blocks while the queue is full
+                        continue
+                    while not stop.is_set():
+                        try:
+                            work.put((index, item), timeout=POLL_INTERVAL)
+                            break
+                        except Queue.Full:
+                            pass
+            finally:
+                for _thread in threads:
+                    work.put(_STOP)
+
+        def __drain(finished):  # unblocks workers waiting on a full done queue
+            while finished < len(threads):
+                if done.get() is _STOP:
+                    finished += 1
+
+        feeder = threading.Thread(target=__feeder)
+        feeder.daemon = True
+        feeder.start()
+        finished = 0
+        expired = False
+        try:
+            while finished < len(threads):
+                if deadline is None:
+                    outcome = done.get()
+                elif deadline.expired():
+                    expired = True
+                    break
+                else:
+                    try:
+                        outcome = done.get(timeout=POLL_INTERVAL)
+                    except Queue.Empty:
+                        continue
+                if outcome is _STOP:
+                    finished += 1
+                    continue
+                index, item, result, error = outcome
+                if deadline is not None:
+                    with pending_lock:
+                        pending.pop(index, None)
+                yield item, result, error
+            if expired:
+                stop.set()
+                with take_lock:  # waits for the feeder to stop taking from items
+                    pass
+                while True:  # results which finished in time
+                    try:
+                        outcome = done.get_nowait()
+                    except Queue.Empty:
+                        break
+                    if outcome is _STOP:
+                        finished += 1
+                        continue
+                    index, item, result, error = outcome
+                    with pending_lock:
+                        pending.pop(index, None)
+                    yield item, result, error
+                with pending_lock:
+                    unfinished = sorted(pending.items())
+                    pending.clear()
+                error = deadline.error()
+                for index, item in unfinished:
+                    yield item, None, error
+                for index, item in indexed_items:  # never taken by the feeder
+                    yield item, None, error
+        finally:
+            stop.set()
+            if expired:  # leave the running requests behind
+                drainer = threading.Thread(target=__drain, args=(finished,))
+                drainer.daemon = True
+                drainer.start()
+            else:
+                __drain(finished)
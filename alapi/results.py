@@ -0,0 +1,88 @@
+""" Results of the fan-out fetches. A FetchResult is the OrderedDict of the objects retrieved by ID, so it is used like
+    the dicts get_events and get_incidents returned before, which also keeps the typed failures of the IDs which could
+    not be retrieved and the seconds each ID took. retry_failed() fetches only the failed IDs again.
+"""
+
+import time
+from collections import OrderedDict
+
+
+def timed(func):
+    """ Wraps func(item) for a WorkerPool so that it returns (result, seconds); an exception raised by func gets the
+        seconds as its elapsed attribute (see events.EventFailure)
+    """
+    def __timed(item):
+        started = time.time()
+        try:
+            result = func(item)
+        except Exception as e:
+            e.elapsed = time.time() - started
+            raise
+        return result, time.time() - started
+    return __timed
+
+
+class FetchResult(OrderedDict):
+    """ {id: retrieved object} in the order of ids (the requested IDs), with failures ({id: EventFailure or
+        IncidentFailure}) and timings ({id: seconds}). fetch(ids) returns the FetchResult of the given IDs and is used
+        by retry_failed.
+    """
+
+    def __init__(self, items=(), ids=None, fetch=None):
+        OrderedDict.__init__(self, items)
+        self.ids = list(ids) if ids is not None else list(self)
+        self.failures = OrderedDict()
+        self.timings = OrderedDict()
+        self.fetch = fetch
+
+    def add(self, item_id, item, elapsed=None):
+        self[item_id] = item
+        self.failures.pop(item_id, None)
+        if elapsed is not None:
+            self.timings[item_id] = elapsed
+
+    def add_failure(self, item_id, failure):
+        self.failures[item_id] = failure
+        if failure.elapsed is not None:
+            self.timings[item_id] = failure.elapsed
+
+    @property
+    def errors(self):
+        """ The messages of the failures """
+        return [failure.message for failure in self.failures.values()]
+
+    def failed_ids(self, category=None):
+        """ The failed IDs, or those which failed with the category (see events.failure_category) """
+        return [i for i, failure in self.failures.items() if category is None or failure.category == category]
+
+    def merge(self, other):
+        """ Takes the items, failures and timings of another FetchResult (of some of the same ids); returns self """
+        for item_id in other.failures:
+            self.pop(item_id, None)
+        self.failures.update(other.failures)
+        self.timings.update(other.timings)
+        items = OrderedDict(self)
+        items.update(other)
+        self.clear()
+        for item_id in OrderedDict.fromkeys(self.ids + other.ids):  # keep the requested order
+            if item_id in items:
+                self[item_id] = items[item_id]
+        for item_id in other:
+            self.failures.pop(item_id, None)
+        return self
+
+    def retry_failed(self, category=None):
+        """ Fetches the failed IDs (of the category, if given) again and merges the outcome in; returns self """
+        failed_ids = self.failed_ids(category)
+        if failed_ids and self.fetch is not None:
+            self.merge(self.fetch(failed_ids))
+        return self
+
+    def to_json(self):
+        to_json = {
+            'results': OrderedDict((i, item.to_json() if hasattr(item, 'to_json') else item)
+                                   for i, item in self.items()),
+            'failures': OrderedDict((i, failure.to_json()) for i, failure in self.failures.items()),
+            'timings': self.timings
+            }
+        return to_json
@@ -0,0 +1,171 @@
+""" Rate limiting and retries for every page and API fetch. Each host gets an AIMD rate controller: a token bucket
+    which only engages once the host throttles us (429, 503 or a timeout); its rate is then cut multiplicatively on
+    every throttle and grows additively while requests succeed, so throughput settles at the highest rate the console
+    accepts. Failed attempts are retried with exponential backoff and jitter, and every attempt is recorded so that
+    lost events can be explained.
+"""
+
+import random
+import threading
+import time
+import urlparse
+import requests
+from transport import DEFAULT_TIMEOUT
+
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+THROTTLE_STATUSES = frozenset([429, 503])
+DEADLINE_SLACK = 0.05  # seconds; a timeout cut to the time left of a deadline can fire this much before it expires
+
+
+class TokenBucket(object):
+    """ Allows rate requests per second with bursts of up to burst requests; rate None does not limit """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate) if rate is not None else None
+        self.burst = float(burst)
+        self.__tokens = float(burst)
+        self.__updated = time.time()
+        self.lock = threading.Lock()  # also held by RateController while it changes rate
+
+    def acquire(self):
+        """ Blocks until a token is available and takes it """
+        while True:
+            with self.lock:
+                now = time.time()
+                rate = self.rate
+                if rate is None:
+                    self.__tokens, self.__updated = self.burst, now
+                    return
+                self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * rate)
+                self.__updated = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / rate
+            time.sleep(wait)
+
+
+class RateController(TokenBucket):
+    """ Token bucket with additive increase / multiplicative decrease of its rate. With rate None (the default) the
+        host is not limited until it first throttles us; the limit then starts at engage_rate and is lifted again once
+        the rate grew back to max_rate.
+    """
+
+    def __init__(self, rate=None, burst=10, min_rate=1, max_rate=200, increase=1, decrease=0.5, engage_rate=50):
+        TokenBucket.__init__(self, rate, burst)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.engage_rate = float(engage_rate)
+
+    def succeeded(self):
+        with self.lock:
+            if self.rate is not None:
+                rate = self.rate + self.increase
+                self.rate = rate if rate < self.max_rate else None
+
+    def throttled(self):
+        with self.lock:
+            if self.rate is None:
+                self.rate = self.engage_rate
+            else:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+
+
+class RetryPolicy(object):
+    """ Exponential backoff with full jitter: attempt n waits a random time up to min(max_delay, base_delay * 2^n) """
+
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=30, retry_statuses=RETRY_STATUSES):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+
+    def delay(self, attempt, response=None):
+        """ Seconds to wait before the attempt following attempt (counted from 1); honours a Retry-After header """
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(self.max_delay, int(retry_after))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class Fetcher(object):
+    """ Performs GET requests on a session with a RateController per host and the RetryPolicy """
+
+    def __init__(self, retry_policy=None, rate_factory=RateController):
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.rate_factory = rate_factory
+        self.__rates = {}
+        self.__lock = threading.Lock()
+
+    def rate_controller(self, host):
+        with self.__lock:
+            if host not in self.__rates:
+                self.__rates[host] = self.rate_factory()
+            return self.__rates[host]
+
+    def rates(self):
+        """ Returns the current {host: requests per second}; None for the hosts which are not limited """
+        with self.__lock:
+            return dict((host, rate.rate) for host, rate in self.__rates.items())
+
+    def get(self, session, url, attempts=None, deadline=None, **kwargs):
+        """ GETs url, retrying on RETRY_STATUSES, timeouts and connection errors. A dict is appended to attempts (if
+            given) for every attempt. Returns the last response once the retries are exhausted (so the caller still
+            sees the failing status), or raises the last requests exception. With a deadline (see deadline.py), no
+            attempt is started once it expired (its error is raised instead), and the timeout of every attempt and the
+            backoff delays are cut to the time remaining; an attempt which times out because of the deadline raises
+            its error too and does not lower the rate of the host.
+        """
+        rate = self.rate_controller(urlparse.urlparse(url).netloc)
+        policy = self.retry_policy
+        timeout = kwargs.pop('timeout', None)  # None is the session's default (see transport.TimeoutAdapter)
+        attempt = 0
+        while True:
+            attempt += 1
+            if deadline is not None:
+                deadline.check()
+            rate.acquire()
+            started = time.time()
+            response = None
+            request_timeout = deadline.timeout(timeout) if deadline is not None else timeout
+            try:
+                response = session.get(url, timeout=request_timeout, **kwargs)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                shortened = request_timeout is not None and request_timeout != (timeout or DEFAULT_TIMEOUT)
+                if deadline is not None and (deadline.expired() or isinstance(e, requests.Timeout) and shortened and
+                                             deadline.remaining() <= DEADLINE_SLACK):
+                    error = deadline.error()  # our deadline ran out, so it says nothing about the host's capacity
+                    self.__record(attempts, {'attempt': attempt, 'status': None, 'error': '{0}: {1}'.format(
+                        type(error).__name__, error)}, started, 0)
+                    raise error
+                rate.throttled()
+                record = {'attempt': attempt, 'status': None, 'error': '{0}: {1}'.format(type(e).__name__, e)}
+                if attempt >= policy.max_attempts:
+                    self.__record(attempts, record, started, 0)
+                    raise
+            else:
+                record = {'attempt': attempt, 'status': response.status_code, 'error': None,
+                          'bytes': len(response.content)}
+                if response.status_code in THROTTLE_STATUSES:
+                    rate.throttled()
+                elif response.status_code not in policy.retry_statuses:
+                    rate.succeeded()
+                if response.status_code not in policy.retry_statuses or attempt >= policy.max_attempts:
+                    self.__record(attempts, record, started, 0)
+                    return response
+            delay = policy.delay(attempt, response)
+            if deadline is not None and deadline.remaining() is not None:
+                delay = min(delay, deadline.remaining())
+            self.__record(attempts, record, started, delay)
+            time.sleep(delay)
+
+    @staticmethod
+    def __record(attempts, record, started, delay):
+        if attempts is not None:
+            record['elapsed'] = time.time() - started
+            record['delay'] = delay
+            attempts.append(record)
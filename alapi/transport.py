@@ -0,0 +1,58 @@
+""" Managed requests sessions. Every Alert Logic host gets its own connection pool sized to the concurrency used
+    against it (see pool.DEFAULT_HOST_LIMITS), and threads wait for a pooled keep-alive connection rather than opening
+    and dropping extra ones. connection_stats() reports how many requests reused a connection versus how many needed
+    a new connection (and TLS handshake). Every request made without its own timeout gets DEFAULT_TIMEOUT, so a hung
+    connection cannot block a worker forever.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from pool import CONSOLE_HOST, API_HOST, DEFAULT_HOST_LIMITS
+
+
+CONSOLE_URL = 'https://{0}'.format(CONSOLE_HOST)
+API_URL = 'https://{0}'.format(API_HOST)
+DEFAULT_TIMEOUT = (10, 60)  # seconds to connect and seconds to wait for each read of the response
+
+
+class TimeoutAdapter(HTTPAdapter):
+    """ HTTPAdapter which gives the requests sent without a timeout its timeout (seconds or (connect, read)) """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, **kwargs):
+        HTTPAdapter.__init__(self, **kwargs)
+        self.timeout = timeout
+
+    def send(self, request, timeout=None, **kwargs):
+        return HTTPAdapter.send(self, request, timeout=timeout if timeout is not None else self.timeout, **kwargs)
+
+
+def new_session(pool_sizes=None, pool_block=True, timeout=DEFAULT_TIMEOUT):
+    """ Returns a requests Session with a keep-alive connection pool per host. pool_sizes is {host: connections} and
+        defaults to the WorkerPool host limits. With pool_block, a thread waits for a free pooled connection instead of
+        opening one which would be discarded afterwards. timeout applies to every request made without one.
+    """
+    pool_sizes = DEFAULT_HOST_LIMITS if pool_sizes is None else pool_sizes
+    session = requests.Session()
+    for prefix in ('https://', 'http://'):
+        session.mount(prefix, TimeoutAdapter(timeout))
+    for host, size in pool_sizes.items():
+        session.mount('https://{0}'.format(host), TimeoutAdapter(timeout, pool_connections=1, pool_maxsize=size,
+                                                                 pool_block=pool_block))
+    return session
+
+
+def connection_stats(session):
+    """ Returns {host: {'requests': n, 'new_connections': n, 'reused_connections': n}} for the session """
+    stats = {}
+    for adapter in session.adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            connection_pool = pools.get(key)
+            if connection_pool is None:
+                continue
+            host_stats = stats.setdefault(connection_pool.host, {'requests': 0, 'new_connections': 0})
+            host_stats['requests'] += connection_pool.num_requests
+            host_stats['new_connections'] += connection_pool.num_connections
+    for host_stats in stats.values():
+        host_stats['reused_connections'] = max(host_stats['requests'] - host_stats['new_connections'], 0)
+    return stats
@@ -7,18 +7,21 @@ can be subsequently set using the set_api_key method.
 # Author: Justin Ibarra (justin.s.ibarra@gmail.com)
 # License: MIT - A full copy of the license is provided with this source code
 
-import requests
 #from bs4 import BeautifulSoup
 import re
 import binascii
-import gzip
-#import zlib  #remove?
-import os
-import subprocess
-import time
 from string import printable
 import threading
+import time
 import traceback
+from collections import OrderedDict
+from decompress import decompress_payload
+import transport
+from incidents import fetch_incident_details
+from errors import NotAuthenticatedError, HttpStatusError
+from events import EventFailure
+from deadline import as_deadline
+from pool import POLL_INTERVAL
 
 
 def get_event(username, password, customer_id, event_number, api_key=None):
@@ -34,13 +37,15 @@ class AlPseudoAPI(object):
     purpose = 'Alert Logic Pseudo API for events'
 
     def __init__(self, username, password, api_key=None):
-        self.__alogic = requests.Session()
+        self.__alogic = transport.new_session()
         self.__login_al(username, password)
         self.__api_key = api_key
         self.event = ''
         self.events = list()
         self.incident = ''
         self.incidents = list()
+        self.failures = OrderedDict()  # event number: EventFailure of the last get_events; see retry_failed
+        self.timings = OrderedDict()   # event number: seconds taken by the last get_events
 
     def __login_al(self, al_un, al_pw):
         login_params = {#'SMENC': 'ISO-8859-1',
@@ -55,53 +60,10 @@ class AlPseudoAPI(object):
             raise Exception('Failed to authenticate. Status code: {0}\nException: {1}'.format(r.status_code, r.reason))
         return
 
-    def __gz_handler(self, event_id, converted_hex):
-        """ Detects and decompresses gzipped hex """
+    def __gz_handler(self, payload):
+        """ Detects and decompresses gzipped (or deflated) data in the payload, in memory """
         #TODO: make this public for use with the raw interactive methods????
-        hold_hex = ''
-        hold_bin = ''
-        decompressed_data = '\n[*] Decompressed data detected'
-        if '0d0a0d0a1f8b08' in converted_hex:  # 0d0a0d0a-packet header delineation, 1f8b08-gz signature
-            hold_hex = converted_hex[converted_hex.find('0d0a0d0a1f8b08') + 8:]
-        elif '1f8b08' in converted_hex:
-            hold_hex = converted_hex[converted_hex.find('1f8b08'):]
-        else:
-            return ''
-        if len(hold_hex) <= 20:  # per RFC1952, gzip header must contain at least 10 bytes (20 hex characters)
-            decompressed_data += '\n[!] Unable to decompress. Too much missing data\n'
-            return decompressed_data
-        try:
-            hold_bin = binascii.a2b_hex(hold_hex)
-        except TypeError:
-            decompressed_data += '\n[!] Potential zipped data detected but unable to convert - check event'
-            return decompressed_data
-        #############################################
-        # TODO: Possibly implement
-        #############################################
-        #gz_handler = gzip.GzipFile(fileobj=hold_bin)
-        #try:
-            #decompressed_data += gz_handler.read()
-            #return decompressed_data
-        #############################################
-        tmp_file_name = '/tmp/{0}_{1}.tmp'.format(event_id, time.time())  # unique name prevents overriding with threading
-        with open(tmp_file_name, 'wb') as outfile:
-            outfile.write(hold_bin)
-        try:
-            with gzip.open(tmp_file_name, 'rb') as f:
-                decompressed_data += f.read()
-        except Exception as e:
-            decompressed_data += '\n[!] Missing zip data detected | Adding partial contents\n\n'
-            output = subprocess.Popen(["zcat", tmp_file_name], stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
-            if output is None:
-                # log error message with output[1]
-                decompressed_data += '\n[!] Something went wrong with zcat output - check event'
-            else:
-                decompressed_data += output[0]
-        if os.path.exists(tmp_file_name):
-            os.remove(tmp_file_name)
-        # would be really awesome to be able to decompress incomplete with zlib instead of fooling with zcat
-        #return zlib.decompress(hold_bin, 16+zlib.MAX_WBITS)
-        return decompressed_data
+        return decompress_payload(payload)
 
     def set_api_key(self, api_key):
         """ used to globally set api key persistently for multiple incident api calls """
@@ -167,35 +129,15 @@ class AlPseudoAPI(object):
                 host = i['payload']['packet_details']['request_packet']['host']
                 response = i['payload']['packet_details']['response_packet']['response_code']
                 event = i['event']
-
-                if signature not in packet_analysis.keys():
-                    packet_analysis[signature] = {host: {response: [event]}}
-                elif host not in packet_analysis[signature].keys():
-                    packet_analysis[signature][host] = {response: [event]}
-                elif response not in packet_analysis[signature][host].keys():
-                    packet_analysis[signature][host][response] = [event]
-                else:
-                    packet_analysis[signature][host][response].append(event)
             except KeyError:
                 continue  # packet failed to retrieve from get_event
+            packet_analysis.setdefault(signature, {}).setdefault(host, {}).setdefault(response, []).append(event)
 
             #######################################################
             # summary
-            # signatures
-            if signature not in unique_signatures.keys():
-                unique_signatures[signature] = sig_applicable_events = [i['event']]
-            else:
-                unique_signatures[signature].append(i['event'])
-            # hosts
-            if host not in unique_hosts.keys():
-                unique_hosts[host] = hosts_applicable_events = [i['event']]
-            else:
-                unique_hosts[host].append(i['event'])
-            # response codes
-            if response not in response_code_tally.keys():
-                response_code_tally[response] = code_applicable_events = [i['event']]
-            else:
-                response_code_tally[response].append(i['event'])
+            unique_signatures.setdefault(signature, []).append(event)
+            unique_hosts.setdefault(host, []).append(event)
+            response_code_tally.setdefault(response, []).append(event)
         packet_info = {
             'details': [packet_analysis],
             'summary': {
@@ -360,8 +302,8 @@ class AlPseudoAPI(object):
         #print r.status_code  # TODO: Add some exception handling here...try 3 times??? raise error? skip with message?
         if r.status_code != 200:
             #return 'Failed to retrieve event #{0}.'.format(event_id)
-            raise Exception('Failed to retrieve event #{0}. Status code: {1}\nReason: {2}'.format(
-                event_id, r.status_code, r.reason))
+            raise HttpStatusError('Failed to retrieve event #{0}. Status code: {1}\nReason: {2}'.format(
+                event_id, r.status_code, r.reason), r.status_code)
         tmp_raw_page = str(r.text)
         ###################################################################
         # REGEX Event Details
@@ -411,7 +353,7 @@ class AlPseudoAPI(object):
         full_payload1 = '{0}'.format(raw3.decode('hex').decode('ascii', 'ignore'))  # what is lost with ignore vs 'replace'
         full_payload = ''.join([c for c in full_payload1 if c in printable])
         packet_details = self.__packet_analysis(full_payload)
-        decompressed = self.__gz_handler(event_id, raw3)
+        decompressed = self.__gz_handler(binascii.unhexlify(raw3))
         full_event = {
             'event':                    event_id,
             'url':                      event_url,
@@ -437,7 +379,7 @@ class AlPseudoAPI(object):
             }
         return full_event
 
-    def get_events(self, customer_id, event_list, summary=False, suppress_errors=True):
+    def get_events(self, customer_id, event_list, summary=False, suppress_errors=True, deadline=None):
         """
         Iterates (threaded) through all of the events provided. If summary is set to true, then return data is sent in
             a JSON structure or else just a list of event JSON will be returned
@@ -447,33 +389,64 @@ class AlPseudoAPI(object):
             of the list of events and a json object of the analysis
         :param suppress_errors: by default, errors for events which failed to retreive will be suppressed. If set to
             false, then an exception will be raised with all of the failed events
-        :return:
+        :param deadline: seconds (or a deadline.Deadline) after which the events still running are given up and
+            returned as failures
+        :return: either way, the failed events are kept in self.failures (typed EventFailures) and the seconds of
+            every event in self.timings, and retry_failed() retrieves only the failed events again
         """
         local_events = []
         threads = []
-        errors = []
+        failures = OrderedDict()
+        timings = OrderedDict()
+        lock = threading.Lock()  # guards the three above and closed
+        closed = []              # set once the results are taken; the threads left running no longer add to them
+        deadline = as_deadline(deadline)
 
         def __multi_get_events(item):  # for threading
+            started = time.time()
+            event, failure = None, None
             try:
-                local_events.append(self.get_event(customer_id, item))
+                event = self.get_event(customer_id, item)
             except Exception as e:
-                errors.append(e.message)
-                pass
+                failure = EventFailure(item, e, time.time() - started)
+            with lock:
+                if closed:
+                    return
+                if failure is not None:
+                    failures[item] = failure
+                else:
+                    local_events.append(event)
+                timings[item] = time.time() - started
 
         for i in event_list:
             t = threading.Thread(target=__multi_get_events, args=(i,))
+            t.daemon = True  # a request still running at the deadline must not keep the process alive
             threads.append(t)
             t.start()
         for _thread in threads:
-            _thread.join()
-        if not suppress_errors:
-            raise Exception('Their were errors receiving some events: {0}'.format(errors))
+            while _thread.is_alive() and not (deadline is not None and deadline.expired()):
+                _thread.join(POLL_INTERVAL if deadline is not None else None)
+        with lock:
+            closed.append(True)
+            finished_events = list(local_events)
+            self.failures = OrderedDict(failures)
+            self.timings = OrderedDict(timings)
+        for i in event_list:
+            if i not in self.timings:
+                self.failures[i] = EventFailure(i, deadline.error())
+        if not suppress_errors and self.failures:
+            raise Exception('Their were errors receiving some events: {0}'.format(
+                [failure.message for failure in self.failures.values()]))
         if summary:
-            data_structure = self.__packet_summary(local_events)
-            data_structure['events'] = local_events
+            data_structure = self.__packet_summary(finished_events)
+            data_structure['events'] = finished_events
             return data_structure
         else:
-            return local_events
+            return finished_events
+
+    def retry_failed(self, customer_id, summary=False, deadline=None):
+        """ Runs get_events for only the events which failed in the last get_events """
+        return self.get_events(customer_id, list(self.failures), summary, deadline=deadline)
 
     def set_incident(self, customer_id, incident_id):  # keep this? persistent global incident?
         self.incident = zip(customer_id, incident_id)
@@ -504,7 +477,7 @@ class AlPseudoAPI(object):
         local_api_key = api_key if api_key is not None else self.__get_api_key()
         url = 'https://api.alertlogic.net/api/incident/v3/incidents?incident_id=' + incident_id + \
               '&customer_id=' + customer_id
-        r = requests.get(url, headers=header, auth=(local_api_key, ''))
+        r = self.__alogic.get(url, headers=header, auth=(local_api_key, ''))
         if r.status_code != 200:
             raise Exception('Failed to retrieve incident. Status code: {0}\nException: {1}'.format(
                 r.status_code, r.reason))
@@ -518,10 +491,17 @@ class AlPseudoAPI(object):
 
     def get_events_from_incidents(self, customer_id, incident_list, api_key=None, persist=False):
         """ Accepts a list of incidents (either from global objects or from incident_id for retrieval) and returns all
-        events associated with each incident """
+        events associated with each incident. The incidents are retrieved in batched incident API calls """
+        local_api_key = api_key if api_key is not None else self.__get_api_key()
+        try:
+            details = fetch_incident_details(self.__alogic, local_api_key, incident_list, customer_id)
+        except NotAuthenticatedError as e:
+            raise Exception('Failed to retrieve incidents.\nException: {0}'.format(e))
         events_from_incidents = list()
         for incident_id in incident_list:
-            events_from_incidents.append(self.get_events_from_incident(customer_id, incident_id, api_key, persist))
+            if str(incident_id) not in details:
+                raise Exception('Events not returned from AL API. Check incident_id: {0}'.format(incident_id))
+            events_from_incidents.append(list(details[str(incident_id)]['event_ids']))
         return events_from_incidents
 
     def raw_event_manipulator(self):
@@ -0,0 +1,71 @@
+""" Watch mode for open incidents. An IncidentWatcher polls the details of all watched incidents in one batched incident
+    API call and remembers each incident's last_modified_date. Only incidents which changed since the last poll (or
+    still have failed events) are refreshed, and a refresh only retrieves the events which were added or failed (see
+    Incident.refresh), so the Incident objects and their EventsPacketSummary stay current at a cost proportional to the
+    new events.
+"""
+
+import time
+from collections import OrderedDict
+from incidents import Incident, AlertLogic, fetch_incident_details
+from pool import WorkerPool
+
+
+class IncidentWatcher(object):
+    """ Keeps an Incident per watched incident id up to date. Credentials are those of the client (see client.py) or
+        otherwise the class level AlertLogic credentials and api key.
+    """
+
+    def __init__(self, incident_ids=(), customer_id=None, client=None, pool=None):
+        self.customer_id = customer_id
+        self.client = client
+        self.pool = pool if pool is not None else WorkerPool()
+        self.incidents = OrderedDict()      # incident_id (str): Incident, or None until the first poll
+        self.last_modified = {}             # incident_id (str): last_modified_date seen by the last poll
+        for incident_id in incident_ids:
+            self.add(incident_id)
+
+    def add(self, incident_id):
+        self.incidents.setdefault(str(incident_id), None)
+
+    def remove(self, incident_id):
+        self.incidents.pop(str(incident_id), None)
+        self.last_modified.pop(str(incident_id), None)
+
+    def poll(self):
+        """ Refreshes every watched incident whose last_modified_date changed or which still has failed events (which
+            the refresh retrieves again). Returns an OrderedDict of
+            {incident_id: [new Events and EventFailures]} for the incidents which were refreshed; incidents the API
+            no longer returns are left as they are.
+        """
+        if self.client is not None:
+            details = fetch_incident_details(self.client.session, self.client.api_key, self.incidents.keys(),
+                                             self.customer_id, fetcher=self.client.get_fetcher())
+        else:
+            details = fetch_incident_details(AlertLogic.alogic, AlertLogic.api_key, self.incidents.keys(),
+                                             self.customer_id)
+        changes = OrderedDict()
+        for incident_id, incident_details in details.items():
+            if incident_id not in self.incidents:
+                continue  # removed while polling
+            last_modified = incident_details.get('last_modified_date')
+            incident = self.incidents[incident_id]
+            if incident is not None and last_modified == self.last_modified.get(incident_id) and not incident.failures:
+                continue
+            if incident is None:
+                incident = self.incidents[incident_id] = Incident(incident_id, self.customer_id, pool=self.pool,
+                                                                  lazy=True, incident_details=incident_details,
+                                                                  client=self.client)
+            changes[incident_id] = incident.refresh(incident_details)
+            self.last_modified[incident_id] = last_modified
+        return changes
+
+    def watch(self, interval=60, polls=None):
+        """ Generator which polls every interval seconds (polls times, or forever) and yields each poll's changes """
+        count = 0
+        while polls is None or count < polls:
+            started = time.time()
+            yield self.poll()
+            count += 1
+            if polls is None or count < polls:
+                time.sleep(max(0, interval - (time.time() - started)))
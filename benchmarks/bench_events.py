@@ -0,0 +1,135 @@
+""" End-to-end and per stage benchmarks of event retrieval against the local mock console (see mock_console.py).
+    Reports events/sec, p50/p99 latency, peak RSS and CPU per event for get_events and get_incidents over the mock,
+    and the time per event of each parse stage of Event.get_event and of the incident summary.
+    Usage: python benchmarks/bench_events.py [--events 2000] [--workers 10] [--latency 0.02] [--error-rate 0.01]
+                                            [--error-status 503] [--body-size 65536] [--gzip-ratio 0.5]
+"""
+
+import argparse
+import binascii
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from alapi import alapi, hexdump, transport
+from alapi.alertlogic import AlertLogic
+from alapi.decompress import decompress_payload
+from alapi.events import Event, packet_analysis
+from alapi.incidents import EventsPacketSummary
+from alapi.pool import WorkerPool, DEFAULT_HOST_LIMITS, CONSOLE_HOST
+from alapi.retry import Fetcher, RetryPolicy, RateController
+import mock_console
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # kilobytes on Linux
+
+
+def cpu_seconds():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def report(name, events, elapsed, cpu):
+    latencies = [sum(a['elapsed'] + a['delay'] for a in event.attempts) for event in events if event.attempts]
+    print '{0:>14} {1:>8} {2:>10.1f} {3:>9.1f} {4:>9.1f} {5:>10.1f} {6:>11.0f}'.format(
+        name, len(events), len(events) / elapsed, percentile(latencies, 0.5) * 1000,
+        percentile(latencies, 0.99) * 1000, peak_rss_mb(), cpu / max(len(events), 1) * 1e6)
+
+
+def reset(url, workers, rate):
+    """ A fresh session on the mock, rate controller and signature cache and no event cache for every run """
+    AlertLogic.fetcher = Fetcher(RetryPolicy(base_delay=0.05),  # the mock recovers from errors at once
+                                 lambda: RateController(rate=rate, burst=workers, max_rate=rate * 10))
+    host_limits = dict(DEFAULT_HOST_LIMITS)
+    host_limits[CONSOLE_HOST] = workers
+    AlertLogic.alogic = mock_console.use_mock_console(transport.new_session(host_limits), url, workers)
+    AlertLogic.al_logged_in = False
+    AlertLogic.event_cache = None
+    AlertLogic.signature_cache.clear()
+    return WorkerPool(max_workers=workers, host_limits=host_limits)
+
+
+def bench_end_to_end(args, url):
+    print '{0:>14} {1:>8} {2:>10} {3:>9} {4:>9} {5:>10} {6:>11}'.format(
+        'run', 'events', 'events/s', 'p50 (ms)', 'p99 (ms)', 'RSS (MB)', 'CPU/event (us)')
+    event_ids = range(1, args.events + 1)
+    pool = reset(url, args.workers, args.rate)
+    started, cpu = time.time(), cpu_seconds()
+    events = alapi.get_events(event_ids, 99, 'bench', 'bench', pool=pool).values()
+    report('get_events', events, time.time() - started, cpu_seconds() - cpu)
+    pool = reset(url, args.workers, args.rate)
+    started, cpu = time.time(), cpu_seconds()
+    incidents = alapi.get_incidents(sorted(args.incidents), 99, 'key', 'bench', 'bench', pool=pool)
+    events = dict((event_id, event) for incident in incidents.values() for event_id, event in incident.Events.items())
+    report('get_incidents', events.values(), time.time() - started, cpu_seconds() - cpu)
+
+
+def bench_stages(config, count):
+    """ Times every stage of the event parsing (and the incident summary) on count pages, in us per event """
+    pages = [config.event_page(event_id) for event_id in range(1, count + 1)]
+    parsed = [Event.page_parser.parse(page) for page in pages]
+    payloads = [binascii.unhexlify(hexdump.raw_hex(fields['raw_hex'])) for fields in parsed]
+    texts = [hexdump.printable_text(payload) for payload in payloads]
+    stages = [
+        ('page parser', lambda: [Event.page_parser.parse(page) for page in pages]),
+        ('hex decoding', lambda: [binascii.unhexlify(hexdump.raw_hex(fields['raw_hex'])) for fields in parsed]),
+        ('printable', lambda: [hexdump.printable_text(payload) for payload in payloads]),
+        ('packet analysis', lambda: [packet_analysis(text) for text in texts]),
+        ('decompression', lambda: [decompress_payload(payload) for payload in payloads])
+        ]
+    AlertLogic.username = AlertLogic.password = None  # Events built from the pages without any request
+    events = {}
+    for event_id, page in enumerate(pages, 1):
+        event = Event(event_id, config.customer_id, lazy=True)
+        event.load_parsed(dict(Event.page_parser.parse(page), payload=payloads[event_id - 1],
+                               packet_details=packet_analysis(texts[event_id - 1])), fetch_signature=False)
+        events[event_id] = event
+    stages.append(('summary', lambda: EventsPacketSummary(events)))
+    print '{0:>16} {1:>12}'.format('stage', 'us/event')
+    for name, stage in stages:
+        started = time.time()
+        stage()
+        print '{0:>16} {1:>12.1f}'.format(name, (time.time() - started) / count * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks event retrieval against a local mock console')
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--incidents', type=int, default=20, help='incidents of events/incidents events each')
+    parser.add_argument('--workers', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per mock response')
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of error responses')
+    parser.add_argument('--error-status', type=int, default=500, help='429 or 503 exercise the rate control')
+    parser.add_argument('--body-size', type=int, default=2048, help='response body bytes per packet')
+    parser.add_argument('--gzip-ratio', type=float, default=0.2)
+    parser.add_argument('--rate', type=float, default=1000, help='starting requests/sec of the rate controller')
+    args = parser.parse_args()
+    per_incident = max(args.events // args.incidents, 1)
+    incident_events = dict((str(i), range(i * per_incident + 1, (i + 1) * per_incident + 1))
+                           for i in range(args.incidents))
+    args.incidents = [int(i) for i in incident_events]
+    config = mock_console.MockConfig(args.latency, args.jitter, args.error_rate, args.body_size, args.gzip_ratio,
+                                     incidents=incident_events, error_status=args.error_status)
+    process, url = mock_console.start_mock_console(config)
+    try:
+        bench_end_to_end(args, url)
+        print
+        bench_stages(config, min(args.events, 500))
+    finally:
+        process.terminate()
+
+
+if __name__ == '__main__':
+    main()
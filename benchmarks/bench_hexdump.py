@@ -0,0 +1,49 @@
+""" Micro-benchmark of the hex dump decoding in Event.get_event: the previous string concatenation and per character
+    printable filter against alapi.hexdump. Usage: python benchmarks/bench_hexdump.py [saved_event_page.html ...]
+"""
+
+import os
+import re
+import sys
+import timeit
+from string import printable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from alapi import hexdump
+from alapi.pageparser import EventPageParser
+import fixtures
+
+
+def legacy_decode(dump_lines):
+    """ The decoding as it was done in Event.get_event before alapi.hexdump """
+    raw2 = re.findall(r'(?<=0x[\da-fA_F]{4}:\s)\b[\da-fA-F]{2,4}\b|(?<=[\da-fA-F]{4}\s)\b[\da-fA-F]{2,4}\b', dump_lines)
+    raw3 = ''
+    for chunk in raw2:
+        raw3 += chunk
+    full_payload1 = '{0}'.format(raw3.decode('hex').decode('ascii', 'ignore'))
+    full_payload = ''.join([c for c in full_payload1 if c in printable])
+    return raw3, full_payload
+
+
+def main(paths):
+    if paths:
+        pages = [(os.path.basename(path), page) for path, page in zip(paths, fixtures.load_pages(paths))]
+    else:
+        pages = [('{0}KB payload'.format(size // 1024), fixtures.event_page(1, body_size=size))
+                 for size in (4096, 65536, 262144, 524288)]
+    parser = EventPageParser()
+    print '{0:>20} {1:>12} {2:>12} {3:>8}'.format('page', 'legacy (ms)', 'hexdump (ms)', 'speedup')
+    for name, page in pages:
+        dump_lines = parser.parse_dump_lines(page)
+        raw_hex, payload, text = hexdump.decode_dump(dump_lines)
+        if (raw_hex, text) != legacy_decode(dump_lines):
+            raise AssertionError('hexdump output differs from the legacy decoding for {0}'.format(name))
+        number = 5
+        legacy = timeit.timeit(lambda: legacy_decode(dump_lines), number=number) / number * 1000
+        current = timeit.timeit(lambda: hexdump.decode_dump(dump_lines), number=number) / number * 1000
+        print '{0:>20} {1:>12.2f} {2:>12.2f} {3:>7.1f}x'.format(name, legacy, current, legacy / current)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,86 @@
+""" Synthetic Alert Logic pages for the benchmarks. The layout follows what alapi parses out of the real console pages
+    (see alapi/pageparser.py); saved real pages can be passed to the benchmarks instead.
+"""
+
+import binascii
+import gzip
+import random
+import StringIO
+
+
+def hex_dump(data):
+    """ Formats data the way the event page shows it: one table row per 16 bytes of offset, hex words and ascii """
+    lines = []
+    for offset in range(0, len(data), 16):
+        chunk = data[offset:offset + 16]
+        hex_chunk = binascii.hexlify(chunk)
+        words = ' '.join(hex_chunk[i:i + 4] for i in range(0, len(hex_chunk), 4))
+        ascii_chunk = ''.join(c if 32 <= ord(c) < 127 and c not in '<>&' else '.' for c in chunk)
+        lines.append('<tr><td>0x{0:04x}: {1}  {2}</td></tr>'.format(offset & 0xffff, words, ascii_chunk))
+    return '\n'.join(lines)
+
+
+def gzip_bytes(data):
+    buf = StringIO.StringIO()
+    gz = gzip.GzipFile(fileobj=buf, mode='wb', mtime=0)
+    gz.write(data)
+    gz.close()
+    return buf.getvalue()
+
+
+def packet(event_id, body_size=200, gzip_body=False, truncate=False, seed=0):
+    """ Returns a request and response pair for the event; the response body is optionally gzipped (and truncated) """
+    rnd = random.Random(seed + int(event_id))
+    request = 'GET /hax/{0} HTTP/1.1\r\nHost: example{1}.net\r\nUser-Agent: bench\r\n\r\n'.format(
+        event_id, int(event_id) % 3)
+    body = ''.join(rnd.choice('ghijklmnopqrstuvwxyz <>\n') for _ in xrange(body_size))
+    if gzip_body:
+        body = gzip_bytes(body)
+        if truncate:
+            body = body[:len(body) * 2 // 3]
+        headers = 'HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\n\r\n'
+    else:
+        headers = 'HTTP/1.1 {0} OK\r\nContent-Type: text/html\r\n\r\n'.format(200 if int(event_id) % 2 else 404)
+    return request + headers + body
+
+
+def event_page(event_id, sig_id=1000, inline_sig=True, body_size=200, gzip_body=False, truncate=False):
+    """ Returns a synthetic event.php page """
+    inline = ''
+    if inline_sig:
+        inline = ('<tr><td>Signature Content:</td>\n'
+                  '<td>alert tcp any any -&gt; any 80 (msg:&quot;bench&quot;;)<br />sid:{0};</td></tr>'.format(sig_id))
+    page = ('<html><head><script>\n'
+            "    var source_addr = '10.0.0.{n}';\n"
+            "    var dest_addr = '192.168.1.1';\n"
+            "    var source_port = '5555';\n"
+            "    var dest_port = '80';\n"
+            "    var signature_name = 'AL Bench Sig {sig}';\n"
+            "    var sensor = 'bench-sensor-ngtm';\n"
+            "    var protocol = 'tcp';\n"
+            "    var classification = 'web-application-attack';\n"
+            "    var severity = '50';\n"
+            '</script></head><body>\n<table>\n'
+            '<tr><td>Engine Time:</td>\n    <td><span class="bold">2017-01-02 03:04:05</span></td></tr>\n'
+            '<tr><td><strong><a href="/signature.php?sid={sig}">AL Bench Sig</a></strong></td></tr>\n'
+            '{inline}\n'
+            '<tr><td>xxxxxxxxxxxxxxx</td><td>Signature: AL Bench Sig</td></tr>\n'
+            '{dump}\n</table>\n'
+            '<table id="cache_table" style="display: none;"><tr><td>x</td></tr></table>\n'
+            '</body></html>').format(n=int(event_id) % 250, sig=sig_id, inline=inline,
+                                     dump=hex_dump(packet(event_id, body_size, gzip_body, truncate)))
+    return page
+
+
+def signature_page(sig_id):
+    return ('<table><tr><th>Signature Content</th>\n'
+            '<td>alert tcp any any -&gt; any any (sid:{0};)</td></tr></table>'.format(sig_id))
+
+
+def load_pages(paths):
+    """ Reads saved event pages from disk """
+    pages = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    return pages
@@ -0,0 +1,179 @@
+""" Local stand-in for the Alert Logic console and incident API, for benchmarking without credentials or network. It
+    serves synthetic event.php and signature.php pages (see fixtures.py), accepts any log-in at forms/login2.fcc and
+    answers incident v3 API queries, with configurable latency, error rate and payload sizes. Sessions are pointed at
+    it with use_mock_console(), which reroutes the console and API hosts without changing alapi.
+
+    python benchmarks/mock_console.py --port 8080 --latency 0.05 --error-rate 0.01
+"""
+
+import argparse
+import BaseHTTPServer
+import json
+import multiprocessing
+import os
+import random
+import SocketServer
+import sys
+import time
+import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from alapi.transport import CONSOLE_URL, API_URL, TimeoutAdapter
+import fixtures
+
+
+class MockConfig(object):
+    """ latency: seconds added to every response (plus up to jitter); error_rate: fraction of page and API requests
+        answered with error_status (429 and 503 also make alapi lower its request rate); body_size: response body bytes in each packet; gzip_ratio: fraction of events with a
+        gzipped (and truncated_ratio of those truncated) body; inline_ratio: fraction of events with the signature rule
+        on the event page; incidents: {incident_id: [event_ids]} for the incident API
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, body_size=2048, gzip_ratio=0.2, truncated_ratio=0.5,
+                 inline_ratio=0.5, signatures=20, customer_id=99, incidents=None, seed=0, error_status=500):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.body_size = body_size
+        self.gzip_ratio = gzip_ratio
+        self.truncated_ratio = truncated_ratio
+        self.inline_ratio = inline_ratio
+        self.signatures = signatures
+        self.customer_id = customer_id
+        self.incidents = incidents if incidents is not None else {}
+        self.seed = seed
+
+    def event_page(self, event_id):
+        rnd = random.Random(self.seed + int(event_id))
+        gzip_body = rnd.random() < self.gzip_ratio
+        return fixtures.event_page(event_id, sig_id=1000 + int(event_id) % self.signatures,
+                                   inline_sig=rnd.random() < self.inline_ratio, body_size=self.body_size,
+                                   gzip_body=gzip_body, truncate=gzip_body and rnd.random() < self.truncated_ratio)
+
+
+class MockConsoleHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so the benchmarks measure pooled connections
+    wbufsize = -1                  # one send per response, which avoids the delayed ACK stall on keep-alive
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        return
+
+    def respond(self, status, body, content_type='text/html'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def delay(self):
+        config = self.server.config
+        if config.latency or config.jitter:
+            time.sleep(config.latency + random.uniform(0, config.jitter))
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.delay()
+        if self.path.startswith('/forms/login2.fcc'):
+            self.respond(200, '<html>logged in</html>')
+        else:
+            self.respond(404, 'not found')
+
+    def do_GET(self):
+        config = self.server.config
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+        self.delay()
+        if url.path in ('/event.php', '/signature.php', '/api/incident/v3/incidents') and \
+                random.random() < config.error_rate:
+            self.respond(config.error_status, 'error')
+        elif url.path == '/event.php':
+            self.respond(200, self.server.page(query['id']))
+        elif url.path == '/signature.php':
+            self.respond(200, fixtures.signature_page(query['sid']))
+        elif url.path == '/api/incident/v3/incidents':
+            incidents = [{'incident_id': int(incident_id), 'customer_id': config.customer_id,
+                          'event_ids': config.incidents[incident_id], 'num_evts': len(config.incidents[incident_id]),
+                          'last_modified_date': 1, 'evolution_tree': {'evolved_from': [], 'incident_id': incident_id}}
+                         for incident_id in query.get('incident_id', '').split(',') if incident_id in config.incidents]
+            self.respond(200, json.dumps(incidents), 'application/json')
+        else:
+            self.respond(404, 'not found')
+
+
+class MockConsole(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, config, port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), MockConsoleHandler)
+        self.config = config
+        self.pages = {}  # generated pages are kept so the server does not limit the benchmarks
+
+    def page(self, event_id):
+        if event_id not in self.pages:
+            self.pages[event_id] = self.config.event_page(event_id)
+        return self.pages[event_id]
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self.server_address[1])
+
+
+def _serve(config, port, ready):
+    server = MockConsole(config, port)
+    ready.put(server.url)
+    server.serve_forever()
+
+
+def start_mock_console(config, port=0):
+    """ Runs a MockConsole in a separate process (so its CPU time and memory are not counted against the client);
+        returns (process, url). Stop it with process.terminate().
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(config, port, ready))
+    process.daemon = True
+    process.start()
+    return process, ready.get(timeout=30)
+
+
+class RerouteAdapter(TimeoutAdapter):
+    """ Sends the requests for a https host prefix to the mock console instead """
+
+    def __init__(self, prefix, target, **kwargs):
+        TimeoutAdapter.__init__(self, **kwargs)
+        self.prefix = prefix
+        self.target = target
+
+    def send(self, request, **kwargs):
+        request.url = self.target + request.url[len(self.prefix):]
+        return TimeoutAdapter.send(self, request, **kwargs)
+
+
+def use_mock_console(session, url, pool_size=10):
+    """ Mounts adapters on a requests session so the console and incident API requests go to the mock at url """
+    for prefix in (CONSOLE_URL, API_URL):
+        session.mount(prefix, RerouteAdapter(prefix, url, pool_connections=1, pool_maxsize=pool_size,
+                                             pool_block=True))
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves a mock Alert Logic console')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--body-size', type=int, default=2048)
+    args = parser.parse_args()
+    server = MockConsole(MockConfig(args.latency, args.jitter, args.error_rate, args.body_size,
+                                    error_status=args.error_status), args.port)
+    print 'Mock console at {0}'.format(server.url)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
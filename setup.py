@@ -1,11 +1,14 @@
-from distutils.core import setup
+from setuptools import setup
 
 
 setup(
     name='AlertLogic_event_api',
     version='2.0.1',
     packages=['alapi'],
-    package_dir={'': 'alapi'},
+    install_requires=['requests'],
+    entry_points={
+        'console_scripts': ['alapi = alapi.cli:main']
+    },
     url='https://github.com/brokensound77/AlertLogic-event-api',
     license='MIT',
     author='brokensound77',
@@ -0,0 +1,71 @@
+""" Behaviour of WorkerPool.map and imap_unordered when a deadline expires or is cancelled: every item comes back,
+    those which did not finish in time with the deadline's error.
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from alapi.deadline import Deadline
+from alapi.errors import DeadlineExceededError, CancelledError
+from alapi.pool import WorkerPool
+
+
+def slow(item):
+    time.sleep(0.1)
+    return item * 2
+
+
+class WorkerPoolDeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool(max_workers=4)
+
+    def assert_outcomes(self, outcomes, items, error_type):
+        self.assertEqual(sorted(item for item, result, error in outcomes), items)
+        finished = [(item, result) for item, result, error in outcomes if error is None]
+        failed = [error for item, result, error in outcomes if error is not None]
+        self.assertTrue(finished, 'some items finish before the deadline')
+        self.assertTrue(failed, 'some items are cut off by the deadline')
+        self.assertTrue(all(result == item * 2 for item, result in finished))
+        self.assertTrue(all(isinstance(error, error_type) for error in failed))
+
+    def test_map_expired(self):
+        outcomes = self.pool.map(slow, range(60), deadline=Deadline(0.3))
+        self.assertEqual([item for item, result, error in outcomes], range(60))
+        self.assert_outcomes(outcomes, range(60), DeadlineExceededError)
+
+    def test_imap_unordered_expired(self):
+        outcomes = list(self.pool.imap_unordered(slow, range(60), deadline=Deadline(0.3)))
+        self.assert_outcomes(outcomes, range(60), DeadlineExceededError)
+
+    def test_imap_unordered_expired_generator(self):
+        outcomes = list(self.pool.imap_unordered(slow, (i for i in range(60)), deadline=Deadline(0.3)))
+        self.assert_outcomes(outcomes, range(60), DeadlineExceededError)
+
+    def test_map_cancelled(self):
+        deadline = Deadline()
+        threading.Timer(0.25, deadline.cancel).start()
+        outcomes = self.pool.map(slow, range(60), deadline=deadline)
+        self.assertEqual([item for item, result, error in outcomes], range(60))
+        self.assert_outcomes(outcomes, range(60), CancelledError)
+
+    def test_imap_unordered_cancelled(self):
+        deadline = Deadline()
+        threading.Timer(0.25, deadline.cancel).start()
+        outcomes = list(self.pool.imap_unordered(slow, range(60), deadline=deadline))
+        self.assert_outcomes(outcomes, range(60), CancelledError)
+
+    def test_no_deadline(self):
+        outcomes = self.pool.map(slow, range(8))
+        self.assertEqual(outcomes, [(i, i * 2, None) for i in range(8)])
+
+
+if __name__ == '__main__':
+    unittest.main()